@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# Greedy colorings on a compact adjacency: the neighbours of node i are
+# targets[offsets[i]:offsets[i+1]] (CSR), and the colors taken around a node
+# are kept as the bits of one python integer.
+#
+#   dsatur: colors next the node with the most distinct colors around it,
+#           ties going to the highest degree, O(E log V) with a lazy heap
+#   rlf:    recursive largest first, builds one color class at a time out of
+#           the uncolored nodes with the most neighbours already excluded
+#           from it; slower but usually a few colors better
+#
+# Colors are numbered from 0.
+
+import heapq
+import numpy
+
+
+class Adjacency:
+
+    def __init__(self, node_count, edges):
+        edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+        # every edge once, so that a neighbour is never listed twice
+        keys = numpy.unique(edges.min(axis=1) * node_count + edges.max(axis=1))
+        edges = numpy.column_stack([keys / node_count, keys % node_count])
+        sources = numpy.concatenate([edges[:, 0], edges[:, 1]])
+        targets = numpy.concatenate([edges[:, 1], edges[:, 0]])
+        order = numpy.argsort(sources, kind='mergesort')
+        self.node_count = node_count
+        self.targets = targets[order]
+        self.degree = numpy.bincount(sources, minlength=node_count)
+        self.offsets = numpy.concatenate([[0], numpy.cumsum(self.degree)])
+
+    def neighbours(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+
+def lowest_free(mask):
+    # index of the lowest zero bit
+    return (~mask & (mask + 1)).bit_length() - 1
+
+
+def dsatur(graph):
+    n = graph.node_count
+    degree = graph.degree.tolist()
+    neighbours = [graph.neighbours(node).tolist() for node in range(n)]
+    masks = [0]*n
+    saturation = [0]*n
+    colors = [-1]*n
+
+    heap = [(0, -degree[node], node) for node in range(n)]
+    heapq.heapify(heap)
+    while heap:
+        (sat, deg, node) = heapq.heappop(heap)
+        if colors[node] != -1 or -sat != saturation[node]:
+            continue
+        color = lowest_free(masks[node])
+        colors[node] = color
+        bit = 1 << color
+        for other in neighbours[node]:
+            if colors[other] == -1 and not masks[other] & bit:
+                masks[other] |= bit
+                saturation[other] += 1
+                heapq.heappush(heap, (-saturation[other], -degree[other], other))
+    return colors
+
+
+def rlf(graph):
+    n = graph.node_count
+    neighbours = [graph.neighbours(node) for node in range(n)]
+    colors = numpy.full(n, -1, dtype=numpy.int64)
+    # neighbours still uncolored
+    free_degree = graph.degree.astype(numpy.int64)
+    color = 0
+    while (colors == -1).any():
+        candidate = colors == -1
+        # neighbours in the excluded set, for the candidates
+        blocked = numpy.zeros(n, dtype=numpy.int64)
+        first = True
+        while candidate.any():
+            if first:
+                score = numpy.where(candidate, free_degree, -1)
+                first = False
+            else:
+                # most neighbours excluded, then fewest still free
+                score = numpy.where(candidate, blocked * (n + 1) + (n - free_degree), -1)
+            node = int(score.argmax())
+
+            colors[node] = color
+            candidate[node] = False
+            around = neighbours[node]
+            free_degree[around] -= 1
+            newly = around[candidate[around]]
+            candidate[newly] = False
+            if len(newly) > 0:
+                blocked += numpy.bincount(numpy.concatenate([neighbours[other] for other in newly]), minlength=n)
+        color += 1
+    return colors.tolist()
@@ -1,11 +1,34 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import instance
+from common import anytime
 from ortools.constraint_solver import pywrapcp
 from ortools.linear_solver import pywraplp
+from ortools.sat.python import cp_model
 import networkx as nx
 import networkx.algorithms.approximation as apxa
 import time
+import multiprocessing
+import construct
+import tabucol
+
+# seconds for the whole run, and the share of what is left that the greedy
+# colorings and the tabu search taking colors away get; the exact model gets
+# the rest
+TIME_LIMIT = 10 * 60
+CONSTRUCT_SHARE = 0.05
+IMPROVE_SHARE = 0.5
+
+# the best coloring so far is kept in this file while the run goes on
+CHECKPOINT = "solution"
+
+# exact model run after the tabu search, 'sat' (CP-SAT) or 'mip' (CBC)
+BACKEND = 'sat'
+SAT_WORKERS = max(multiprocessing.cpu_count(), 1)
 
 
 def remap(nodes):
@@ -22,7 +45,9 @@ def remap(nodes):
     return result
 
 
-def cp_solve(edges, node_count, cliques, presets, max_allowed_colors, timeout):
+def cp_solve(edges, node_count, cliques, presets, max_allowed_colors, driver):
+    # returns (coloring, optimal), the coloring None when there is none within
+    # the driver's time limit
     solver = pywraplp.Solver('CP is fun!', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING);
 # GLPK_MIXED_INTEGER_PROGRAMMING
 # CBC_MIXED_INTEGER_PROGRAMMING
@@ -33,30 +58,38 @@ def cp_solve(edges, node_count, cliques, presets, max_allowed_colors, timeout):
     colors = range(max_allowed_colors)
     nodes = range(node_count)
     nodes_colors = [[solver.BoolVar('n%s_c%s' % (node,color)) for color in colors] for node in nodes]
-    obj = solver.IntVar(1, max_allowed_colors)
+    used = [solver.BoolVar('c%s' % color) for color in colors]
 
     for node in nodes:
-        node_colors = nodes_colors[node]
-        solver.Add ( solver.Sum(node_colors) == 1 ) # one color per node
+        solver.Add ( solver.Sum(nodes_colors[node]) == 1 ) # one color per node
+
+    for color in colors[1:]:
+        solver.Add ( used[color - 1] >= used[color] ) # colors taken in order
+
+    # at most one node per color in every clique, and only colors in use;
+    # the edges no clique covers get a row of their own
+    covered = set()
+    for clique in cliques:
+        clique = sorted(clique)
         for color in colors:
-            solver.Add( obj >= color*node_colors[color] )
-    
+            solver.Add ( solver.Sum([nodes_colors[node][color] for node in clique]) <= used[color] )
+        for (i, left) in enumerate(clique):
+            for right in clique[i+1:]:
+                covered.add((left, right))
+
     for edge in edges:
-        print edge
+        if (min(edge), max(edge)) in covered:
+            continue
         left = nodes_colors[edge[0]]
         right = nodes_colors[edge[1]]
         for color in colors:
-            solver.Add ( left[color] + right[color] <= 1  ) # Different colors
+            solver.Add ( left[color] + right[color] <= used[color] ) # Different colors
 
     for (node, value) in presets:
         for color in colors:
-            solver.Add(nodes_colors[node][color] == (color == value))
-
-    #for clique in cliques:
-	#    solver.Add(solver.AllDifferent([nodes_values[node] for node in clique]))
-	    
+            nodes_colors[node][color].SetBounds(int(color == value), int(color == value))
 
-    objective = solver.Minimize(obj)
+    objective = solver.Minimize(solver.Sum(used))
 
     #
     # solution and search
@@ -64,9 +97,11 @@ def cp_solve(edges, node_count, cliques, presets, max_allowed_colors, timeout):
 
     print "starting search"
 
-    solver.SetTimeLimit(timeout)
-    result_status = solver.Solve()
-    assert result_status == pywraplp.Solver.OPTIMAL
+    solver.SetTimeLimit(int(driver.native_limit() * 1000))
+    result_status = driver.native(solver.Solve)
+    if result_status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        print "no coloring with " + str(max_allowed_colors) + " colors found"
+        return (None, False)
     solution = [sum([color if nodes_colors[node][color].SolutionValue() > 0 else 0 for color in colors]) for node in nodes]
 
     #solution = solver.Assignment()
@@ -90,7 +125,78 @@ def cp_solve(edges, node_count, cliques, presets, max_allowed_colors, timeout):
     #print "branches:", solver.Branches()
     print "WallTime:", solver.WallTime()
                            
-    return remap(solution)
+    return (remap(solution), result_status == pywraplp.Solver.OPTIMAL)
+
+class SolutionLogger(cp_model.CpSolverSolutionCallback):
+
+    def __init__(self, variables, on_improve=None):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._variables = variables
+        self._on_improve = on_improve
+        self.solution = None
+
+    def on_solution_callback(self):
+        self.solution = [self.Value(variable) for variable in self._variables]
+        print "colors:", max(self.solution) + 1, "WallTime:", self.WallTime()
+        if self._on_improve is not None:
+            self._on_improve(remap(self.solution))
+
+
+def hint_colors(hint, presets, max_allowed_colors):
+    # renames the colors of the hint so that it agrees with the presets
+    mapping = dict((hint[node], value) for (node, value) in presets)
+    free = [color for color in range(max_allowed_colors) if color not in mapping.values()]
+    for color in sorted(set(hint)):
+        if color not in mapping:
+            mapping[color] = free.pop(0)
+    return [mapping[color] for color in hint]
+
+
+def sat_solve(edges, node_count, cliques, presets, max_allowed_colors, driver, hint=None, on_improve=None):
+    # returns (coloring, optimal) as cp_solve does; every coloring found on
+    # the way is also handed to on_improve
+    model = cp_model.CpModel()
+
+    print "solving with " + str(max_allowed_colors) + " colors"
+
+    nodes = [model.NewIntVar(0, max_allowed_colors - 1, 'n%s' % node) for node in range(node_count)]
+
+    covered = set()
+    for clique in cliques:
+        clique = sorted(clique)
+        model.AddAllDifferent([nodes[node] for node in clique])
+        for (i, left) in enumerate(clique):
+            for right in clique[i+1:]:
+                covered.add((left, right))
+
+    for edge in edges:
+        if (min(edge), max(edge)) not in covered:
+            model.Add ( nodes[edge[0]] != nodes[edge[1]] )
+
+    for (node, value) in presets:
+        model.Add ( nodes[node] == value )
+
+    obj = model.NewIntVar(0, max_allowed_colors - 1, 'obj')
+    model.AddMaxEquality(obj, nodes)
+    model.Minimize(obj)
+
+    if hint is not None and max(hint) < max_allowed_colors:
+        for (node, color) in enumerate(hint_colors(hint, presets, max_allowed_colors)):
+            model.AddHint(nodes[node], color)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.num_search_workers = SAT_WORKERS
+
+    print "starting search"
+
+    logger = SolutionLogger(nodes, on_improve)
+    solver.parameters.max_time_in_seconds = driver.native_limit()
+    status = driver.native(solver.SolveWithSolutionCallback, model, logger)
+    print "status:", solver.StatusName(status), "WallTime:", solver.WallTime()
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE) or logger.solution is None:
+        print "no coloring with " + str(max_allowed_colors) + " colors found"
+        return (None, False)
+    return (remap(logger.solution), status == cp_model.OPTIMAL)
 
 def get_graph(node_count, edges):
     G = nx.Graph()
@@ -100,102 +206,118 @@ def get_graph(node_count, edges):
     return G
 
 
-def preset(node, neighbors, presets):
-    if not node in presets:
-        values = sorted([presets[n] for n in neighbors if n in presets])
-        value = 0
-        if len(values) > 0:
-            values = values + [max(values)+2] # last item is the forced max value +2
-            for i in range(len(values)): # find an "emtpy slot"
-                if values[i+1] - values[i] > 1:
-                    value = values[i] + 1
-                    break
-        presets[node] = value
-
-def sorted_by_degree(G):
-    degrees = [(node, nx.degree(G, node)) for node in G]    
-    degrees = sorted(degrees, key=lambda t: -t[1])
-    return degrees
-
-def preset_most_connected(G, limit):
-    degrees = sorted_by_degree(G)
-    most_connected = degrees[:limit]
-    
-    presets = {}
-
-    for (node, degree) in most_connected:
-        neighbors = [n for n in G[node]]
-        preset(node, neighbors, presets)
-    
-    return [(node, presets[node]) for node in presets]
-
 def cliques_for_nodes(G, nodes):
     return [apxa.max_clique(G)]
 
-def super_greedy(G):
-    degrees = sorted_by_degree(G)
-
-    tabu = set()
-
-    nodes = len(degrees)
-
-    solution = [-1] * nodes
-    solved = 0
-
-    current_color = 0
+def clique_cover(graph):
+    # cliques covering every edge, each one grown greedily from an edge not
+    # covered yet through the common neighbours, preferring the ones whose
+    # edges to the clique are not covered either; neighbour sets are bitmasks
+    n = graph.node_count
+    neighbours = [sum(1 << other for other in graph.neighbours(node).tolist()) for node in range(n)]
+    uncovered = list(neighbours)
+    cliques = []
+    for node in range(n):
+        while uncovered[node] >> (node + 1):
+            rest = uncovered[node] >> (node + 1) << (node + 1)
+            other = (rest & -rest).bit_length() - 1
+            clique = [node, other]
+            candidates = neighbours[node] & neighbours[other]
+            fresh = uncovered[node] & uncovered[other]
+            while candidates:
+                pool = candidates & fresh or candidates
+                best = (pool & -pool).bit_length() - 1
+                clique.append(best)
+                candidates &= neighbours[best]
+                fresh &= uncovered[best]
+            members = sum(1 << member for member in clique)
+            for member in clique:
+                uncovered[member] &= ~members
+            cliques.append(clique)
+    return cliques
+
+def greedy_coloring(graph):
+    best = None
+    for heuristic in (construct.dsatur, construct.rlf):
+        start = time.time()
+        solution = heuristic(graph)
+        print heuristic.__name__, max(solution) + 1, "colors", time.time() - start, "seconds"
+        if best is None or max(solution) < max(best):
+            best = solution
+    return best
+    
 
-    while(solved < nodes):
-        print "color: ", current_color, "solved: ", solved
-        for (node, degree) in degrees:
-            if solution[node] == -1 and not node in tabu:
-                solution[node] = current_color
-                tabu |= set(G[node])
-                solved+=1
-        tabu = set()        
-        current_color+=1
+def format_output(color_count, solution, optimal=False):
+    output_data = str(color_count) + ' ' + str(1 if optimal else 0) + '\n'
+    output_data += ' '.join(map(str, solution))
+    return output_data
 
-    return solution
-    
 
 def solve_it(input_data):
     # Modify this code to run your optimization algorithm
 
     # parse the input
-    lines = input_data.split('\n')
+    problem = instance.parse(input_data, 'coloring')
 
-    first_line = lines[0].split()
-    node_count = int(first_line[0])
-    edge_count = int(first_line[1])
-
-    edges = []
-    for i in range(1, edge_count + 1):
-        line = lines[i]
-        parts = line.split()
-        edges.append((int(parts[0]), int(parts[1])))
+    node_count = problem.node_count
+    edges = [tuple(edge) for edge in problem.edges.tolist()]
         
     G = get_graph(node_count, edges)
     
-    #solution = super_greedy(G)
-
-    presets = preset_most_connected(G, 12)
-    print presets
-
-    cliques = cliques_for_nodes(G, [preset[0] for preset in presets])
-    print cliques
-
-    solution = [node_count]
-    
-    for lap in range(5):
-        solution = cp_solve(edges, node_count, cliques, presets, max(solution), 20 * 1000)
-        print solution
+    graph = construct.Adjacency(node_count, problem.edges)
+    driver = anytime.Anytime(TIME_LIMIT, CHECKPOINT, format_output)
+    proven = []
+
+    def offer(solution):
+        driver.offer(max(solution) + 1, solution)
+
+    # the clique cover for the exact model, and the largest clique found,
+    # a lower bound on the colors that stops the search early
+    cliques = clique_cover(graph)
+    print len(cliques), "cliques cover", len(edges), "edges"
+    largest = max(cliques_for_nodes(G, range(node_count)) + cliques, key=len)
+
+    def construct_phase(seconds):
+        offer(greedy_coloring(graph))
+
+    def improve_phase(seconds):
+        solution = tabucol.reduce(graph, driver.solution(), seconds, on_improve=offer, floor=len(largest))
+        print "tabucol:", max(solution) + 1, "colors"
+
+    def prove_phase(seconds):
+        # the largest clique gets its colors fixed up front
+        presets = [(node, color) for (color, node) in enumerate(sorted(largest))]
+        print presets
+
+        # optimal once the colors come down to the size of a clique, or when
+        # the exact model proves its coloring is
+        while driver.value() > len(largest):
+            if driver.native_limit() <= 0:
+                return
+            solution = driver.solution()
+            before = driver.value()
+            if BACKEND == 'sat':
+                (found, optimal) = sat_solve(edges, node_count, cliques, presets, driver.value(), driver, solution, offer)
+            else:
+                (found, optimal) = cp_solve(edges, node_count, cliques, presets, driver.value(), driver)
+            if found is None:
+                return
+            # the sat search has already offered what it found on the way
+            offer(found)
+            if optimal and driver.value() == max(found) + 1:
+                break
+            if driver.value() == before:
+                return
+        proven.append(True)
+
+    (color_count, solution) = driver.run([
+        ('construct', CONSTRUCT_SHARE, construct_phase),
+        ('improve', IMPROVE_SHARE, improve_phase),
+        ('prove', 1.0, prove_phase),
+    ])
 
-    color_count = max(solution) + 1
-    
     # prepare the solution in the specified output format
-    output_data = str(color_count) + ' ' + str(1) + '\n'
-    output_data += ' '.join(map(str, solution))
-
-    return output_data
+    return format_output(color_count, solution, len(proven) > 0)
 
 
 import sys
@@ -203,9 +325,7 @@ import sys
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
+        input_data = instance.load(file_location, 'coloring')
         print solve_it(input_data)
     else:
         print 'This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/gc_4_1)'
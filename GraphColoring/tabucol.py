@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# Tabucol: tabu search over complete, possibly conflicting, k-colorings.
+# gamma[node][color] counts the neighbours of node having that color, so
+# recoloring node from a to b changes the number of conflicting edges by
+# gamma[node][b] - gamma[node][a], and a move only touches the gamma rows of
+# the node's neighbours. Only conflicting nodes are moved; the color a node
+# leaves stays tabu for it for a while, unless taking it back reaches a new
+# best.
+#
+# reduce drops one color at a time: the nodes of the last color are spread
+# over the others and the conflicts searched away, until the budget ends
+# with some left or a known lower bound (a clique) is reached.
+
+import time
+import numpy
+
+# tabu tenure: TENURE_BASE plus a random part plus this share of the
+# conflicting nodes
+TENURE_BASE = 0
+TENURE_RANDOM = 10
+TENURE_SHARE = 0.6
+
+# how many iterations run between two looks at the clock
+CLOCK_INTERVAL = 100
+
+
+def conflicts(graph, colors, k):
+    # gamma as described above, for the colors 0..k-1
+    n = graph.node_count
+    sources = numpy.repeat(numpy.arange(n), graph.degree)
+    gamma = numpy.zeros((n, k), dtype=numpy.int64)
+    numpy.add.at(gamma, (sources, colors[graph.targets]), 1)
+    return gamma
+
+
+def tabucol(graph, colors, k, deadline, rand):
+    # searches a legal coloring with k colors from the given one; returns it,
+    # or None when the deadline comes first
+    n = graph.node_count
+    colors = numpy.array(colors, dtype=numpy.int64)
+    gamma = conflicts(graph, colors, k)
+    nodes = numpy.arange(n)
+    cost = int(gamma[nodes, colors].sum()) / 2
+    best_cost = cost
+    tabu = numpy.zeros((n, k), dtype=numpy.int64)
+    iteration = 0
+
+    while cost > 0:
+        iteration += 1
+        if iteration % CLOCK_INTERVAL == 0 and time.time() > deadline:
+            return None
+
+        own = gamma[nodes, colors]
+        conflicting = numpy.flatnonzero(own > 0)
+        delta = gamma[conflicting] - own[conflicting, None]
+        delta[numpy.arange(len(conflicting)), colors[conflicting]] = n * n
+        allowed = (tabu[conflicting] <= iteration) | (cost + delta < best_cost)
+        delta = numpy.where(allowed, delta, n * n)
+
+        best = delta.min()
+        if best >= n * n:
+            continue
+        (rows, columns) = numpy.nonzero(delta == best)
+        pick = rand.randint(len(rows))
+        node = conflicting[rows[pick]]
+        color = columns[pick]
+
+        old = colors[node]
+        around = graph.neighbours(node)
+        gamma[around, old] -= 1
+        gamma[around, color] += 1
+        colors[node] = color
+        tabu[node, old] = iteration + TENURE_BASE + rand.randint(TENURE_RANDOM) + int(TENURE_SHARE * len(conflicting))
+        cost += int(best)
+        best_cost = min(best_cost, cost)
+
+    return colors.tolist()
+
+
+def reduce(graph, solution, time_limit, seed=None, on_improve=None, floor=1):
+    # fewest colors reached within the time limit, but not below floor,
+    # starting from a legal coloring; returns the best legal coloring found,
+    # and hands every improvement to on_improve when given
+    deadline = time.time() + time_limit
+    rand = numpy.random.RandomState(seed)
+    best = list(solution)
+    k = max(best)
+    while k >= max(floor, 1) and time.time() < deadline:
+        colors = numpy.array(best, dtype=numpy.int64)
+        # the nodes of the dropped color go where they conflict the least
+        dropped = numpy.flatnonzero(colors == k)
+        colors[dropped] = 0
+        gamma = conflicts(graph, colors, k)
+        for node in dropped:
+            color = int(gamma[node].argmin())
+            gamma[graph.neighbours(node), colors[node]] -= 1
+            gamma[graph.neighbours(node), color] += 1
+            colors[node] = color
+
+        print "tabucol with", k, "colors"
+        found = tabucol(graph, colors, k, deadline, rand)
+        if found is None:
+            break
+        best = found
+        k = max(best)
+        if on_improve is not None:
+            on_improve(best)
+    return best
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# Anytime driver shared by the solvers. A run has one global deadline and a
+# list of phases (typically construct, improve, prove) that each get a slice
+# of the time left when they start. Phases hand every solution they find to
+# offer(); the best one is kept as the incumbent and written to the
+# checkpoint file whenever it improves, so a killed run still leaves its best
+# answer behind.
+#
+# Stopping is cooperative: python phases look at expired() (or call check()),
+# native solvers are given native_limit(), which ends MARGIN seconds before
+# the deadline so that their result still reaches offer(). An alarm set
+# MARGIN seconds past the deadline is only a backstop for a phase that never
+# looks at the clock; it is held back while a native solver runs (see
+# native()), as it could otherwise go off inside one of its python callbacks.
+
+import os
+import time
+import signal
+import threading
+
+# seconds between the end of a native solver's time limit and the deadline,
+# and between the deadline and the backstop alarm
+MARGIN = 2.0
+
+
+class Deadline(Exception):
+    pass
+
+
+class Anytime:
+
+    def __init__(self, time_limit, checkpoint=None, output=None, maximize=False):
+        # output(value, solution) renders a solution for the checkpoint
+        self.deadline = time.time() + time_limit
+        self.checkpoint = checkpoint
+        self.output = output
+        self.maximize = maximize
+        # (value, solution), replaced as a whole so that the alarm never
+        # leaves half of it updated
+        self.incumbent = (None, None)
+        self.in_native = False
+
+    def remaining(self):
+        return max(self.deadline - time.time(), 0)
+
+    def native_limit(self):
+        # seconds a native solver may run when started now
+        return max(self.deadline - MARGIN - time.time(), 0)
+
+    def expired(self):
+        return time.time() >= self.deadline
+
+    def check(self):
+        if self.expired():
+            raise Deadline()
+
+    def value(self):
+        return self.incumbent[0]
+
+    def solution(self):
+        return self.incumbent[1]
+
+    def better(self, value):
+        if self.incumbent[0] is None:
+            return True
+        return value > self.incumbent[0] if self.maximize else value < self.incumbent[0]
+
+    def offer(self, value, solution):
+        # keeps the solution when it beats the incumbent, returns whether it did
+        if solution is None or not self.better(value):
+            return False
+        self.incumbent = (value, solution)
+        print "incumbent:", value, "with", "%.1f" % self.remaining(), "seconds left"
+        if self.checkpoint is not None and self.output is not None:
+            write_checkpoint(self.checkpoint, self.output(value, solution))
+        return True
+
+    def native(self, function, *args):
+        # runs a call into a native solver, which has to honour native_limit()
+        # by itself; the backstop alarm waits until it returns
+        self.in_native = True
+        try:
+            return function(*args)
+        finally:
+            self.in_native = False
+
+    def _alarm(self, signum, frame):
+        if self.in_native:
+            signal.setitimer(signal.ITIMER_REAL, MARGIN)
+            return
+        raise Deadline()
+
+    def run(self, phases):
+        # phases are (name, share, function); function(seconds) runs with
+        # `share` of the time left, the last phase with all of it. Returns
+        # (value, solution) of the incumbent.
+        alarm = hasattr(signal, 'setitimer') and isinstance(threading.current_thread(), threading._MainThread)
+        if alarm:
+            previous = signal.signal(signal.SIGALRM, self._alarm)
+            signal.setitimer(signal.ITIMER_REAL, self.remaining() + MARGIN)
+        try:
+            for (i, (name, share, function)) in enumerate(phases):
+                if self.expired():
+                    break
+                seconds = self.remaining() * (1.0 if i == len(phases) - 1 else share)
+                print "phase", name, "for", "%.1f" % seconds, "seconds"
+                function(seconds)
+        except Deadline:
+            print "deadline reached"
+        finally:
+            if alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+        if self.incumbent[1] is None:
+            raise RuntimeError("no solution found within the time limit")
+        return self.incumbent
+
+
+def write_checkpoint(location, text):
+    # written aside and renamed, so the checkpoint is never half written
+    tmp_location = location + '.tmp'
+    try:
+        tmp_file = open(tmp_location, 'w')
+        try:
+            tmp_file.write(text)
+        finally:
+            tmp_file.close()
+        os.rename(tmp_location, location)
+    except (IOError, OSError):
+        pass
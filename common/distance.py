@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# Euclidean distances between points (anything with x and y attributes),
+# scaled so they can be handed to the integer routing solvers. Depending on
+# the number of points and the memory available the distances are kept as
+#
+#   dense:    a full float32 matrix built in one vectorized pass
+#   packed:   the lower triangle only, in a flat float32 array
+#   ondemand: nothing but the k nearest neighbours of every point, any
+#             other distance is computed when asked for
+#
+# so that the big instances never try to build a quadratic table.
+
+import math
+import numpy
+
+from common.spatial import Grid
+
+DENSE = 'dense'
+PACKED = 'packed'
+ONDEMAND = 'ondemand'
+
+DENSE_MAX_NODES = 5000
+PACKED_MAX_NODES = 20000
+
+# share of the available memory a table may take
+MEMORY_SHARE = 0.5
+DEFAULT_AVAILABLE_MEMORY = 2 * 1024**3
+
+# rows of the dense matrix computed at once, so that the float64
+# temporaries stay a few blocks in size instead of several full tables
+DENSE_BLOCK_ROWS = 256
+
+
+def available_memory():
+    try:
+        for line in open('/proc/meminfo'):
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return DEFAULT_AVAILABLE_MEMORY
+
+
+def choose_mode(n, memory=None):
+    budget = (memory or available_memory()) * MEMORY_SHARE
+    if n <= DENSE_MAX_NODES and n * n * 4 <= budget:
+        return DENSE
+    if n <= PACKED_MAX_NODES and n * (n+1) * 2 <= budget:
+        return PACKED
+    return ONDEMAND
+
+
+class DistanceMatrix:
+
+    def __init__(self, points, scale=100, mode=None):
+        self._points = points
+        self._scale = scale
+        self._x = numpy.array([p.x for p in points], dtype=numpy.float64)
+        self._y = numpy.array([p.y for p in points], dtype=numpy.float64)
+        self._neighbours = None
+        self._neighbour_distances = None
+
+        l = len(points)
+        self.mode = mode or choose_mode(l)
+
+        if self.mode == DENSE:
+            self._distances = numpy.empty((l, l), dtype=numpy.float32)
+            for start in range(0, l, DENSE_BLOCK_ROWS):
+                end = min(start + DENSE_BLOCK_ROWS, l)
+                self._distances[start:end] = self.rows(numpy.arange(start, end))
+        elif self.mode == PACKED:
+            # row i holds the distances to points 0..i
+            self._distances = numpy.empty(l*(l+1)/2, dtype=numpy.float32)
+            for i in range(l):
+                k = i*(i+1)/2
+                self._distances[k:k+i+1] = self.rows(numpy.array([i]), i+1)[0]
+        else:
+            self._distances = None
+
+    def rows(self, ids, columns=None):
+        # distances from the given points to the first `columns` points
+        columns = len(self._points) if columns is None else columns
+        dx = self._x[ids, None] - self._x[None, :columns]
+        dy = self._y[ids, None] - self._y[None, :columns]
+        return (numpy.sqrt(dx*dx + dy*dy) * self._scale).astype(numpy.float32)
+
+    def _distance(self, i, j):
+        dx = self._points[i].x - self._points[j].x
+        dy = self._points[i].y - self._points[j].y
+        return math.sqrt(dx*dx + dy*dy) * self._scale
+
+    def get(self, i, j):
+        if self.mode == DENSE:
+            return float(self._distances[i, j])
+        if self.mode == PACKED:
+            if j > i:
+                i, j = j, i
+            return float(self._distances[i*(i+1)/2 + j])
+        return self._distance(i, j)
+
+    def neighbours(self, k):
+        # ids and distances of the k nearest points of every point, computed
+        # once through the spatial grid so that only nearby cells are compared
+        l = len(self._points)
+        k = max(min(k, l - 1), 1)
+        if self._neighbours is not None and self._neighbours.shape[1] >= k:
+            return (self._neighbours[:, :k], self._neighbour_distances[:, :k])
+
+        (neighbours, distances) = Grid(self._x, self._y).all_nearest(k)
+        self._neighbours = neighbours
+        self._neighbour_distances = (distances * self._scale).astype(numpy.float32)
+        return (self._neighbours, self._neighbour_distances)
+
+    def obj(self, solution):
+        # length of the closed tour visiting the given point ids
+        tour = numpy.asarray(solution)
+        following = numpy.roll(tour, -1)
+        dx = self._x[tour] - self._x[following]
+        dy = self._y[tour] - self._y[following]
+        return float(numpy.sqrt(dx*dx + dy*dy).sum() * self._scale)
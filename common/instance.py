@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# Instance parsing shared by all the solvers. Every data file is just
+# whitespace separated numbers, so the whole file is tokenized by numpy in a
+# single call (straight from a memory map when reading from disk) and sliced
+# into typed columns, without building a python string per line.
+#
+# Parsed instances are cached as a compressed .npz next to their data file,
+# tagged with a hash of the file contents so that an edited file is parsed
+# again.
+
+import os
+import mmap
+import hashlib
+from collections import namedtuple
+import numpy
+
+# bump when a parser changes the layout of its instance
+CACHE_VERSION = 1
+
+KnapsackInstance = namedtuple("KnapsackInstance", ['capacity', 'values', 'weights'])
+TspInstance = namedtuple("TspInstance", ['x', 'y'])
+ColoringInstance = namedtuple("ColoringInstance", ['node_count', 'edges'])
+FacilityInstance = namedtuple("FacilityInstance", ['setup_costs', 'capacities', 'facility_x', 'facility_y', 'demands', 'customer_x', 'customer_y'])
+VrpInstance = namedtuple("VrpInstance", ['vehicle_count', 'vehicle_capacity', 'demands', 'x', 'y'])
+
+
+def _columns(tokens, start, rows, width):
+    return tokens[start:start + rows*width].reshape(rows, width).T
+
+
+def parse_knapsack(tokens):
+    item_count = int(tokens[0])
+    (values, weights) = _columns(tokens, 2, item_count, 2)
+    return KnapsackInstance(int(tokens[1]), values.astype(numpy.int64), weights.astype(numpy.int64))
+
+
+def parse_tsp(tokens):
+    node_count = int(tokens[0])
+    (x, y) = _columns(tokens, 1, node_count, 2)
+    return TspInstance(x.copy(), y.copy())
+
+
+def parse_coloring(tokens):
+    edge_count = int(tokens[1])
+    edges = tokens[2:2 + edge_count*2].reshape(edge_count, 2).astype(numpy.int32)
+    return ColoringInstance(int(tokens[0]), edges)
+
+
+def parse_facility(tokens):
+    facility_count = int(tokens[0])
+    customer_count = int(tokens[1])
+    (setup_costs, capacities, facility_x, facility_y) = _columns(tokens, 2, facility_count, 4)
+    (demands, customer_x, customer_y) = _columns(tokens, 2 + facility_count*4, customer_count, 3)
+    return FacilityInstance(setup_costs.copy(), capacities.astype(numpy.int64), facility_x.copy(), facility_y.copy(),
+        demands.astype(numpy.int64), customer_x.copy(), customer_y.copy())
+
+
+def parse_vrp(tokens):
+    customer_count = int(tokens[0])
+    (demands, x, y) = _columns(tokens, 3, customer_count, 3)
+    return VrpInstance(int(tokens[1]), int(tokens[2]), demands.astype(numpy.int64), x.copy(), y.copy())
+
+
+PARSERS = {
+    'knapsack': parse_knapsack,
+    'tsp': parse_tsp,
+    'coloring': parse_coloring,
+    'facility': parse_facility,
+    'vrp': parse_vrp,
+}
+
+
+INSTANCE_TYPES = {
+    'knapsack': KnapsackInstance,
+    'tsp': TspInstance,
+    'coloring': ColoringInstance,
+    'facility': FacilityInstance,
+    'vrp': VrpInstance,
+}
+
+
+def tokenize(input_data):
+    return numpy.fromstring(input_data, dtype=numpy.float64, sep=' ')
+
+
+def cache_location(file_location):
+    return file_location + '.npz'
+
+
+def read_cache(file_location, key, kind):
+    try:
+        cached = numpy.load(cache_location(file_location))
+    except (IOError, OSError, ValueError):
+        return None
+
+    try:
+        if str(cached['key']) != key:
+            return None
+        # scalar fields come back as 0-d arrays
+        fields = [(name, cached[name]) for name in INSTANCE_TYPES[kind]._fields]
+        return INSTANCE_TYPES[kind](**dict([(name, value if value.ndim else value.item()) for (name, value) in fields]))
+    finally:
+        cached.close()
+
+
+def write_cache(file_location, key, problem):
+    fields = problem._asdict()
+    tmp_location = cache_location(file_location) + '.tmp'
+    try:
+        tmp_file = open(tmp_location, 'wb')
+        try:
+            numpy.savez_compressed(tmp_file, key=key, **fields)
+        finally:
+            tmp_file.close()
+        os.rename(tmp_location, cache_location(file_location))
+    except (IOError, OSError):
+        # a read only data directory just means no cache
+        pass
+
+
+def load(file_location, kind, use_cache=True):
+    data_file = open(file_location, 'rb')
+    try:
+        data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            key = '%s:%d:%s' % (kind, CACHE_VERSION, hashlib.sha1(data).hexdigest())
+
+            if use_cache:
+                problem = read_cache(file_location, key, kind)
+                if problem is not None:
+                    return problem
+
+            problem = PARSERS[kind](tokenize(data))
+        finally:
+            data.close()
+    finally:
+        data_file.close()
+
+    if use_cache:
+        write_cache(file_location, key, problem)
+    return problem
+
+
+def parse(input_data, kind):
+    # accepts either the text of a data file or an already parsed instance
+    if isinstance(input_data, basestring):
+        return PARSERS[kind](tokenize(input_data))
+    return input_data
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Arc cost setup for the OR-tools routing models of tsp and vrp. The
+# RoutingModel(n, vehicles) / SetCost API used here only takes a python
+# callback, so every arc evaluation still enters a python frame; what can be
+# saved is the work inside it. The callback is a single python frame: when
+# the distances are already held as a dense matrix and a table of python
+# ints fits the memory budget, the costs are rounded once and it is a bare
+# list lookup; otherwise it computes the distance from coordinate lists,
+# which is cheaper than indexing the packed numpy table. The calls are only
+# counted when COUNT_CALLS is set, as that takes a second frame per call.
+
+import math
+import numpy
+
+from common.distance import DENSE, MEMORY_SHARE, available_memory
+
+# bytes one cost takes in nested python lists: the list slot plus the int
+LIST_CELL_BYTES = 32
+
+# count the arc evaluations made through python, for comparing setups
+COUNT_CALLS = False
+
+
+def cost_matrix(distances, memory=None):
+    # integer costs between all the points as nested lists, or None when the
+    # distances are not held densely or the lists would not fit the budget
+    if distances.mode != DENSE:
+        return None
+    l = len(distances._points)
+    budget = (memory or available_memory()) * MEMORY_SHARE
+    if l * l * LIST_CELL_BYTES > budget:
+        return None
+    # row by row, so that no temporary of the full table is made
+    return [numpy.rint(row).astype(numpy.int64).tolist() for row in distances._distances]
+
+
+class CountingCallback:
+
+    def __init__(self, function):
+        self._function = function
+        self.calls = 0
+
+    def __call__(self, i, j):
+        self.calls += 1
+        return self._function(i, j)
+
+
+def cost_callback(distances):
+    # integer arc cost function, one python frame per call
+    matrix = cost_matrix(distances)
+    if matrix is not None:
+        def cost(i, j):
+            return matrix[i][j]
+        return cost
+
+    xs = distances._x.tolist()
+    ys = distances._y.tolist()
+    scale = distances._scale
+    sqrt = math.sqrt
+    def cost(i, j):
+        dx = xs[i] - xs[j]
+        dy = ys[i] - ys[j]
+        return int(sqrt(dx*dx + dy*dy) * scale + 0.5)
+    return cost
+
+
+def set_cost(routing, distances):
+    # registers the arc costs on the routing model and returns the python
+    # callback in use
+    callback = cost_callback(distances)
+    if COUNT_CALLS:
+        callback = CountingCallback(callback)
+    routing.SetCost(callback)
+    return callback
+
+
+def report(routing, callback):
+    solver = routing.solver()
+    if isinstance(callback, CountingCallback):
+        print "arc evaluations through python:", callback.calls
+    print "branches:", solver.Branches(), "failures:", solver.Failures()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+# Uniform grid over a point set, for the rectangle, radius and nearest
+# neighbour queries of the routing solvers. Points are bucketed in square
+# cells holding a couple of points each and sorted by cell, so the points of
+# a row of cells are one contiguous slice and a query only looks at the
+# cells it overlaps instead of scanning every point.
+#
+# split partitions a point set in balanced clusters of nearby points, for the
+# decomposition of the big instances.
+
+import math
+import numpy
+
+# average number of points per cell
+CELL_POINTS = 2.0
+
+# rings of cells looked at around a cell before falling back to a point by
+# point search in all_nearest
+NEAREST_RINGS = 2
+
+
+class Grid:
+
+    def __init__(self, xs, ys, cell_points=CELL_POINTS):
+        self.x = numpy.asarray(xs, dtype=numpy.float64)
+        self.y = numpy.asarray(ys, dtype=numpy.float64)
+        n = len(self.x)
+
+        self.x0 = self.x.min() if n else 0.0
+        self.y0 = self.y.min() if n else 0.0
+        width = (self.x.max() - self.x0) if n else 0.0
+        height = (self.y.max() - self.y0) if n else 0.0
+        # points on a line would make the cells far too thin otherwise
+        side = max(width, height, 1e-9)
+        area = max(width * height, side * side / max(n, 1))
+        self.cell = max(math.sqrt(area * cell_points / max(n, 1)), 1e-9)
+
+        self.cols = int(width / self.cell) + 1
+        self.rows = int(height / self.cell) + 1
+
+        cx = self._col(self.x)
+        cy = self._row(self.y)
+        cells = cy * self.cols + cx
+        self.order = numpy.argsort(cells, kind='mergesort').astype(numpy.int32)
+        self.starts = numpy.searchsorted(cells[self.order], numpy.arange(self.rows * self.cols + 1))
+
+    @staticmethod
+    def from_points(points):
+        return Grid([p.x for p in points], [p.y for p in points])
+
+    def _col(self, x):
+        return numpy.clip(((x - self.x0) / self.cell).astype(numpy.int64), 0, self.cols - 1)
+
+    def _row(self, y):
+        return numpy.clip(((y - self.y0) / self.cell).astype(numpy.int64), 0, self.rows - 1)
+
+    def _cells(self, c0, r0, c1, r1):
+        # ids of the points in the block of cells [c0, c1] x [r0, r1]
+        c0 = max(c0, 0)
+        r0 = max(r0, 0)
+        c1 = min(c1, self.cols - 1)
+        r1 = min(r1, self.rows - 1)
+        if c0 > c1 or r0 > r1:
+            return numpy.zeros(0, dtype=numpy.int32)
+        parts = [self.order[self.starts[r * self.cols + c0]:self.starts[r * self.cols + c1 + 1]] for r in range(r0, r1 + 1)]
+        return numpy.concatenate(parts)
+
+    def rect(self, x0, y0, x1, y1):
+        # ids of the points inside the rectangle, borders included
+        ids = self._cells(int(math.floor((x0 - self.x0) / self.cell)), int(math.floor((y0 - self.y0) / self.cell)),
+                          int(math.floor((x1 - self.x0) / self.cell)), int(math.floor((y1 - self.y0) / self.cell)))
+        x = self.x[ids]
+        y = self.y[ids]
+        return ids[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+
+    def radius(self, x, y, r):
+        # ids of the points within distance r of (x, y)
+        ids = self.rect(x - r, y - r, x + r, y + r)
+        dx = self.x[ids] - x
+        dy = self.y[ids] - y
+        return ids[dx*dx + dy*dy <= r*r]
+
+    def nearest(self, x, y, k, exclude=None):
+        # ids of the k points nearest to (x, y), closest first
+        n = len(self.x) - (1 if exclude is not None else 0)
+        k = min(k, n)
+        if k <= 0:
+            return numpy.zeros(0, dtype=numpy.int32)
+
+        cx = int(self._col(numpy.array([x]))[0])
+        cy = int(self._row(numpy.array([y]))[0])
+        ring = 0
+        while True:
+            ids = self._cells(cx - ring, cy - ring, cx + ring, cy + ring)
+            if exclude is not None:
+                ids = ids[ids != exclude]
+            covered = cx - ring <= 0 and cy - ring <= 0 and cx + ring >= self.cols - 1 and cy + ring >= self.rows - 1
+            if len(ids) >= k:
+                dx = self.x[ids] - x
+                dy = self.y[ids] - y
+                d = dx*dx + dy*dy
+                best = numpy.argsort(d, kind='mergesort')[:k]
+                # anything outside the searched block is at least ring cells away
+                if covered or d[best[-1]] <= (ring * self.cell)**2:
+                    return ids[best]
+            ring += 1
+
+    def all_nearest(self, k):
+        # (ids, distances) of the k nearest neighbours of every point, one
+        # cell at a time against the block of cells around it
+        n = len(self.x)
+        k = min(k, n - 1)
+        neighbours = numpy.empty((n, k), dtype=numpy.int32)
+        distances = numpy.empty((n, k), dtype=numpy.float64)
+        if k <= 0:
+            return (neighbours, distances)
+
+        limit = (NEAREST_RINGS * self.cell)**2
+        for r in range(self.rows):
+            for c in range(self.cols):
+                cell = r * self.cols + c
+                ids = self.order[self.starts[cell]:self.starts[cell + 1]]
+                if len(ids) == 0:
+                    continue
+                around = self._cells(c - NEAREST_RINGS, r - NEAREST_RINGS, c + NEAREST_RINGS, r + NEAREST_RINGS)
+                dx = self.x[ids, None] - self.x[None, around]
+                dy = self.y[ids, None] - self.y[None, around]
+                d = dx*dx + dy*dy
+                d[around[None, :] == ids[:, None]] = numpy.inf
+                if len(around) - 1 >= k:
+                    best = numpy.argsort(d, axis=1, kind='mergesort')[:, :k]
+                    rows = numpy.arange(len(ids))[:, None]
+                    best_d = d[rows, best]
+                    exact = best_d[:, -1] <= limit
+                else:
+                    exact = numpy.zeros(len(ids), dtype=numpy.bool_)
+                if exact.any():
+                    neighbours[ids[exact]] = around[best[exact]]
+                    distances[ids[exact]] = numpy.sqrt(best_d[exact])
+                for i in numpy.flatnonzero(~exact):
+                    found = self.nearest(self.x[ids[i]], self.y[ids[i]], k, exclude=ids[i])
+                    neighbours[ids[i]] = found
+                    distances[ids[i]] = numpy.hypot(self.x[found] - self.x[ids[i]], self.y[found] - self.y[ids[i]])
+        return (neighbours, distances)
+
+
+def split(xs, ys, size):
+    # balanced partition of the points in clusters of at most `size` points,
+    # cutting recursively across the wider side of the bounding box; the
+    # clusters come out in the order of the cuts, so consecutive ones are
+    # next to each other
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    ys = numpy.asarray(ys, dtype=numpy.float64)
+    size = max(int(size), 1)
+    clusters = []
+    stack = [numpy.arange(len(xs), dtype=numpy.int32)]
+    while stack:
+        ids = stack.pop()
+        if len(ids) <= size:
+            if len(ids) > 0:
+                clusters.append(ids)
+            continue
+        x = xs[ids]
+        y = ys[ids]
+        key = x if x.max() - x.min() >= y.max() - y.min() else y
+        # as many clusters on each side as the points ask for
+        count = (len(ids) + size - 1) / size
+        cut = len(ids) * (count / 2) / count
+        order = numpy.argsort(key, kind='mergesort')
+        stack.append(ids[order[cut:]])
+        stack.append(ids[order[:cut]])
+    return clusters
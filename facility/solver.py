@@ -1,6 +1,11 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import instance
+from common import anytime
 from collections import namedtuple
 import math
 from ortools.constraint_solver import pywrapcp
@@ -10,30 +15,88 @@ Point = namedtuple("Point", ['x', 'y'])
 Facility = namedtuple("Facility", ['index', 'setup_cost', 'capacity', 'location', 'usage_variable', 'usage_constraint', 'capacity_constraint'])
 Customer = namedtuple("Customer", ['index', 'demand', 'location', 'facility_variables'])
 
+# seconds for the whole run, the best assignment so far is kept in CHECKPOINT
+TIME_LIMIT = 60 * 60
+CHECKPOINT = "solution"
+
 def length(point1, point2):
     return math.sqrt((point1.x - point2.x)**2 + (point1.y - point2.y)**2)
 
+def format_output(value, solution, optimal=False):
+    output_data = str(value) + ' ' + str(1 if optimal else 0) + '\n'
+    output_data += ' '.join(map(str, solution))
+    return output_data
+
+def solve_greedy(facilities, customers):
+    # biggest customers first, each to the facility with room left that is
+    # cheapest to reach, counting the setup cost when it is not open yet
+    room = [facility.capacity for facility in facilities]
+    opened = [False] * len(facilities)
+    solution = [-1] * len(customers)
+    cost = 0
+
+    for customer in sorted(customers, key=lambda customer: -customer.demand):
+        best = None
+        for facility in facilities:
+            if room[facility.index] < customer.demand:
+                continue
+            price = length(customer.location, facility.location)
+            if not opened[facility.index]:
+                price += facility.setup_cost
+            if best is None or price < best[0]:
+                best = (price, facility.index)
+        if best is None:
+            return (None, None)
+        (price, index) = best
+        room[index] -= customer.demand
+        opened[index] = True
+        solution[customer.index] = index
+        cost += price
+
+    return (cost, solution)
+
 def solve_it(input_data):
     # Modify this code to run your optimization algorithm
 
-    M = 10000000
-
     # parse the input
-    lines = input_data.split('\n')
+    problem = instance.parse(input_data, 'facility')
 
-    parts = lines[0].split()
-    facility_count = int(parts[0])
-    customer_count = int(parts[1])
+    facility_count = len(problem.setup_costs)
+    customer_count = len(problem.demands)
     
     facilities = []
-    for i in range(1, facility_count+1):
-        parts = lines[i].split()
-        facilities.append(Facility(i-1, float(parts[0]), int(parts[1]), Point(float(parts[2]), float(parts[3])), None, None, None ))
+    for (i, (setup_cost, capacity, x, y)) in enumerate(zip(problem.setup_costs.tolist(), problem.capacities.tolist(), problem.facility_x.tolist(), problem.facility_y.tolist())):
+        facilities.append(Facility(i, setup_cost, capacity, Point(x, y), None, None, None ))
 
     customers = []
-    for i in range(facility_count+1, facility_count+1+customer_count):
-        parts = lines[i].split()
-        customers.append(Customer(i-1-facility_count, int(parts[0]), Point(float(parts[1]), float(parts[2])), []))
+    for (i, (demand, x, y)) in enumerate(zip(problem.demands.tolist(), problem.customer_x.tolist(), problem.customer_y.tolist())):
+        customers.append(Customer(i, demand, Point(x, y), []))
+
+    driver = anytime.Anytime(TIME_LIMIT, CHECKPOINT, format_output)
+    proven = []
+
+    def construct_phase(seconds):
+        driver.offer(*solve_greedy(facilities, customers))
+
+    def prove_phase(seconds):
+        (value, solution, optimal) = solve_mip(facilities, customers, driver)
+        driver.offer(value, solution)
+        if optimal and driver.value() == value:
+            proven.append(True)
+
+    (value, solution) = driver.run([
+        ('construct', 0.0, construct_phase),
+        ('prove', 1.0, prove_phase),
+    ])
+
+    # prepare the solution in the specified output format
+    return format_output(value, solution, len(proven) > 0)
+
+def solve_mip(facilities, customers, driver):
+    # returns (objective, solution, optimal), or Nones when no solution was
+    # found within the driver's time limit
+
+    M = 10000000
 
     solver = pywraplp.Solver('CP is fun!', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING);
 # GLPK_MIXED_INTEGER_PROGRAMMING
@@ -70,7 +133,7 @@ def solve_it(input_data):
     print "capacity", total_capacity
 
 
-    variables = facility_count
+    variables = len(facilities)
 
     for customer in customers:
 		facilities_distances = [(facility, length(customer.location, facility.location)) for facility in facilities]
@@ -99,11 +162,12 @@ def solve_it(input_data):
     print "variables", variables
     print "starting search"
 
-    solver.SetTimeLimit(1 * 60 * 60 * 1000 - 5000)
-    result_status = solver.Solve()
+    solver.SetTimeLimit(int(driver.native_limit() * 1000))
+    result_status = driver.native(solver.Solve)
     print "WallTime:", solver.WallTime()
     print "Status:",result_status
-    assert (result_status == pywraplp.Solver.OPTIMAL) or (result_status == pywraplp.Solver.FEASIBLE)
+    if result_status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        return (None, None, False)
 
 
     solution = [-1]*len(customers)
@@ -119,15 +183,7 @@ def solve_it(input_data):
     #for customer in customers:
     #    obj += length(customer.location, facilities[solution[customer.index]].location)
 
-    # prepare the solution in the specified output format
-    output_data = str(objective.Value()) + ' ' + str(1) + '\n'
-    output_data += ' '.join(map(str, solution))
-
-    f = open("solution",'w')
-    f.write(output_data)
-    f.close()
-
-    return output_data
+    return (objective.Value(), solution, result_status == pywraplp.Solver.OPTIMAL)
 
 
 import sys
@@ -135,9 +191,7 @@ import sys
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
+        input_data = instance.load(file_location, 'facility')
         print 'Solving:', file_location
         solution = solve_it(input_data)
         print solution
@@ -1,12 +1,35 @@
 import java.io.*;
 import java.util.List;
 import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.Collections;
+import java.util.Comparator;
 
 /**
- * The class <code>Solver</code> is an implementation of a greedy algorithm to solve the knapsack problem.
+ * The class <code>Solver</code> solves the knapsack problem exactly, with a dynamic programming table of
+ * packed decision bits for small instances and a branch and bound for large capacities.
  *
+ * It either solves a single instance given with <code>-file=</code>, or with <code>-worker</code>
+ * keeps running and serves instances from the standard input. Every request and every answer in
+ * worker mode is a line with the length in bytes followed by that many bytes of text.
  */
 public class Solver {
+
+    /**
+     * Above this many (item, capacity) cells the decision table is not built and branch and bound is used
+     */
+    public static final long DP_MAX_CELLS = 500000000L;
+
+    /**
+     * Milliseconds the branch and bound gets per instance; past them the best solution found is
+     * returned, flagged as not proven optimal
+     */
+    public static final long TIME_LIMIT_MILLIS = 5 * 60 * 1000L;
+
+    /**
+     * Branch and bound nodes visited between two looks at the clock (a power of two)
+     */
+    public static final long CLOCK_INTERVAL = 1 << 16;
     
     /**
      * The main class
@@ -30,6 +53,10 @@ public class Solver {
             if(arg.startsWith("-file=")){
                 fileName = arg.substring(6);
             } 
+            if(arg.equals("-worker")){
+                serve(System.in, System.out);
+                return;
+            }
         }
         if(fileName == null)
             return;
@@ -48,9 +75,50 @@ public class Solver {
             input.close();
         }
         
+        System.out.print(solveInstance(lines));
+    }
         
+    /**
+     * Solve length-prefixed instances one after the other until the input is closed
+     */
+    public static void serve(InputStream in, OutputStream out) throws IOException {
+        DataInputStream input = new DataInputStream(new BufferedInputStream(in));
+        OutputStream output = new BufferedOutputStream(out);
+
+        String header = null;
+        while ((header = readHeader(input)) != null){
+            byte[] data = new byte[Integer.parseInt(header.trim())];
+            input.readFully(data);
+
+            List<String> lines = Arrays.asList(new String(data, "US-ASCII").split("\r?\n"));
+            byte[] solution = solveInstance(lines).getBytes("US-ASCII");
+
+            output.write((solution.length + "\n").getBytes("US-ASCII"));
+            output.write(solution);
+            output.flush();
+        }
+    }
+
+    /**
+     * Read the length line of a request, or null when the input is closed
+     */
+    private static String readHeader(InputStream input) throws IOException {
+        StringBuilder header = new StringBuilder();
+        int c;
+        while ((c = input.read()) != '\n'){
+            if(c == -1)
+                return header.length() == 0 ? null : header.toString();
+            header.append((char) c);
+        }
+        return header.toString();
+    }
+
+    /**
+     * Solve the instance given by the lines of its data file and return the solution text
+     */
+    public static String solveInstance(List<String> lines) {
         // parse the data in the file
-        String[] firstLine = lines.get(0).split("\\s+");
+        String[] firstLine = lines.get(0).trim().split("\\s+");
         int items = Integer.parseInt(firstLine[0]);
         int capacity = Integer.parseInt(firstLine[1]);
 
@@ -58,34 +126,190 @@ public class Solver {
         int[] weights = new int[items];
 
         for(int i=1; i < items+1; i++){
-          String line = lines.get(i);
+          String line = lines.get(i).trim();
           String[] parts = line.split("\\s+");
 
           values[i-1] = Integer.parseInt(parts[0]);
           weights[i-1] = Integer.parseInt(parts[1]);
         }
 
-        // a trivial greedy algorithm for filling the knapsack
-        // it takes items in-order until the knapsack is full
-        int value = 0;
-        int weight = 0;
-        int[] taken = new int[items];
+        int[] taken;
+        boolean[] complete = {true};
+        if((long) items * (capacity+1) <= DP_MAX_CELLS){
+            taken = solveDP(values, weights, capacity);
+        } else {
+            long deadline = System.currentTimeMillis() + TIME_LIMIT_MILLIS;
+            taken = solveBranchAndBound(values, weights, capacity, deadline, complete);
+        }
 
+        long value = 0;
         for(int i=0; i < items; i++){
-            if(weight + weights[i] <= capacity){
-                taken[i] = 1;
-                value += values[i];
-                weight += weights[i];
-            } else {
-                taken[i] = 0;
-            }
+            value += taken[i] * (long) values[i];
         }
-        
+
         // prepare the solution in the specified output format
-        System.out.println(value+" 0");
+        StringBuilder solution = new StringBuilder();
+        solution.append(value+" "+(complete[0] ? 1 : 0)+"\n");
+        for(int i=0; i < items; i++){
+            solution.append(taken[i]+" ");
+        }
+        solution.append("\n");
+        return solution.toString();
+    }
+
+    /**
+     * Dynamic programming over a single value column, keeping one take/skip bit per (item, capacity) cell
+     */
+    public static int[] solveDP(int[] values, int[] weights, int capacity) {
+        int items = values.length;
+        int words = (capacity >> 6) + 1;
+
+        long[] col = new long[capacity+1];
+        long[][] decisions = new long[items][];
+
         for(int i=0; i < items; i++){
-            System.out.print(taken[i]+" ");
+            int weight = weights[i];
+            long[] goes = new long[words];
+            decisions[i] = goes;
+
+            // descending so col[c - weight] still holds the previous item's value
+            for(int c=capacity; c >= weight; c--){
+                long withItem = col[c - weight] + values[i];
+                if(withItem > col[c]){
+                    col[c] = withItem;
+                    goes[c >> 6] |= 1L << (c & 63);
+                }
+            }
+        }
+        
+        int[] taken = new int[items];
+        int current = capacity;
+        for(int i=items-1; i >= 0; i--){
+            if((decisions[i][current >> 6] & (1L << (current & 63))) != 0){
+                taken[i] = 1;
+                current -= weights[i];
+            }
+        }
+        return taken;
+    }
+
+    /**
+     * Depth first branch and bound over the items sorted by value density, pruned with the fractional
+     * (Dantzig) relaxation. All the search state is kept in flat arrays. The search stops at the
+     * deadline with the best solution so far, and complete[0] tells whether it ran to the end.
+     */
+    public static int[] solveBranchAndBound(int[] values, int[] weights, int capacity, long deadline, boolean[] complete) {
+        final int[] v = values;
+        final int[] w = weights;
+
+        List<Integer> candidates = new ArrayList<Integer>();
+        for(int i=0; i < values.length; i++){
+            if(weights[i] <= capacity)
+                candidates.add(i);
+        }
+        Collections.sort(candidates, new Comparator<Integer>() {
+            public int compare(Integer a, Integer b) {
+                return Double.compare((double) v[b] / w[b], (double) v[a] / w[a]);
+            }
+        });
+
+        int n = candidates.size();
+        int[] order = new int[n];
+        long[] sortedValues = new long[n];
+        long[] sortedWeights = new long[n];
+        long[] prefixValues = new long[n+1];
+        long[] prefixWeights = new long[n+1];
+        for(int i=0; i < n; i++){
+            order[i] = candidates.get(i);
+            sortedValues[i] = values[order[i]];
+            sortedWeights[i] = weights[order[i]];
+            prefixValues[i+1] = prefixValues[i] + sortedValues[i];
+            prefixWeights[i+1] = prefixWeights[i] + sortedWeights[i];
+        }
+
+        long bestValue = 0;
+        byte[] best = new byte[n];
+        byte[] current = new byte[n];
+
+        // every node is (depth, value, room, decision for depth-1); as the search is depth first
+        // current[0..depth) always holds the path of the node on top of the stack
+        int[] stackDepth = new int[2*n+2];
+        long[] stackValue = new long[2*n+2];
+        long[] stackRoom = new long[2*n+2];
+        byte[] stackGoes = new byte[2*n+2];
+        stackRoom[0] = capacity;
+        int top = 1;
+        long visited = 0;
+
+        while(top > 0){
+            visited++;
+            if((visited & (CLOCK_INTERVAL-1)) == 0 && System.currentTimeMillis() > deadline)
+                break;
+
+            top--;
+            int i = stackDepth[top];
+            long value = stackValue[top];
+            long room = stackRoom[top];
+            if(i > 0)
+                current[i-1] = stackGoes[top];
+
+            if(value > bestValue){
+                bestValue = value;
+                System.arraycopy(current, 0, best, 0, i);
+                Arrays.fill(best, i, n, (byte) 0);
+            }
+
+            if(i == n || bound(i, value, room, sortedValues, sortedWeights, prefixValues, prefixWeights) <= bestValue)
+                continue;
+
+            stackDepth[top] = i+1;
+            stackValue[top] = value;
+            stackRoom[top] = room;
+            stackGoes[top] = 0;
+            top++;
+
+            if(sortedWeights[i] <= room){
+                stackDepth[top] = i+1;
+                stackValue[top] = value + sortedValues[i];
+                stackRoom[top] = room - sortedWeights[i];
+                stackGoes[top] = 1;
+                top++;
+            }
+        }
+
+        complete[0] = top == 0;
+
+        int[] taken = new int[values.length];
+        for(int i=0; i < n; i++){
+            taken[order[i]] = best[i];
+        }
+        return taken;
+    }
+
+    /**
+     * Fractional relaxation of the items from depth i on, for the given room left
+     */
+    private static long bound(int i, long value, long room, long[] values, long[] weights, long[] prefixValues, long[] prefixWeights) {
+        int n = values.length;
+
+        // last k with prefixWeights[k] <= prefixWeights[i] + room
+        long limit = prefixWeights[i] + room;
+        int low = i;
+        int high = n;
+        while(low < high){
+            int middle = (low + high + 1) >>> 1;
+            if(prefixWeights[middle] <= limit)
+                low = middle;
+            else
+                high = middle - 1;
+        }
+        int k = low;
+
+        value += prefixValues[k] - prefixValues[i];
+        if(k < n){
+            room -= prefixWeights[k] - prefixWeights[i];
+            value += room * values[k] / weights[k];
         }
-        System.out.println("");        
+        return value;
     }
 }
\ No newline at end of file
@@ -1,95 +1,437 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import instance
+from common import anytime
 from collections import namedtuple
+from bisect import bisect_right
+from fractions import gcd
+import array
+import numpy
 
-Item = namedtuple("Item", ['index', 'value', 'weight', 'includes'])
+Item = namedtuple("Item", ['index', 'value', 'weight'])
+Reduction = namedtuple("Reduction", ['items', 'capacity', 'original', 'fixed', 'incumbent'])
 
+# above this many (item, capacity) cells the DP table is not worth building
+# and the low memory DP or branch and bound is used instead
+DP_MAX_CELLS = 50000000
 
-def solve_it(input_data):
-    # Modify this code to run your optimization algorithm
+# the low memory DP stops splitting and keeps a decision table once a
+# subproblem gets this small
+LOW_MEMORY_LEAF_CELLS = 1000000
 
-    # parse the input
-    lines = input_data.split('\n')
+# the low memory DP is used past DP_MAX_CELLS while its two int64 columns
+# stay under this capacity and its work (about twice the cells of the plain
+# table) under this many cells; branch and bound is used beyond
+LOW_MEMORY_MAX_CAPACITY = 125000000
+LOW_MEMORY_MAX_CELLS = 20000000000
 
-    firstLine = lines[0].split()
-    item_count = int(firstLine[0])
-    capacity = int(firstLine[1])
+# capacities updated at once in a low memory DP column, bounding the
+# temporary of the shifted values
+COLUMN_BLOCK = 1 << 22
 
-    items = []
-    
-    print "Capacity: "
-    print capacity
-    print "Items: "
-    print item_count
+# seconds for the whole run; past it the best solution found is returned,
+# flagged as not proven optimal
+TIME_LIMIT = 5 * 60
 
-    for i in range(1, item_count+1):
-        line = lines[i]
-        parts = line.split()
-        items.append(Item(i-1, int(parts[0]), int(parts[1]), list()))
-    
-    last_col = [0]*(capacity+1)
+# the best solution so far is kept in this file while the run goes on
+CHECKPOINT = "solution"
+
+# branch and bound nodes visited between two looks at the clock
+CLOCK_INTERVAL = 10000
+
+
+def solve_dp(items, capacity):
+    # one column of best values per capacity, updated in place for every item
+    # with a vectorized shift-and-max. The take/skip decision of every
+    # (item, capacity) cell is kept as a single bit in a packed matrix.
+
+    col = numpy.zeros(capacity+1, dtype=numpy.int64)
+    decisions = numpy.zeros((len(items), (capacity+8) / 8), dtype=numpy.uint8)
+    goes = numpy.zeros(capacity+1, dtype=numpy.bool_)
 
     for item in items:
-      new_col = list(last_col)
-      goes = False
-      for current_capacity in range(item.weight, capacity+1):
-
-        value_to_assign = last_col[current_capacity]
-    	value_with_item = last_col[current_capacity - item.weight] + item.value
-    	  
-    	new_goes = False
-    	if (value_with_item > value_to_assign):
-    	  value_to_assign = value_with_item
-    	  new_goes = True
-    	    
-    	if (new_goes != goes):
-    	  goes = new_goes
-    	  item.includes.append(current_capacity)
-
-        new_col[current_capacity] = value_to_assign
-
-      last_col = new_col
-      print item.index
-
-
-    total_value = last_col[capacity]
-            
+      if item.weight > capacity:
+        continue
+
+      value_with_item = col[:capacity+1-item.weight] + item.value
+      new_goes = value_with_item > col[item.weight:]
+
+      goes[:item.weight] = False
+      goes[item.weight:] = new_goes
+      decisions[item.index] = numpy.packbits(goes)
+
+      numpy.maximum(col[item.weight:], value_with_item, out=col[item.weight:])
+
+    total_value = int(col[capacity])
+
     taken = [0]*len(items)
     current_capacity = capacity
     acc_value = 0
-    
-    
+
     for item in reversed(items):
-    
-      goes = False
-      for capacity_switch in item.includes:
-        if capacity_switch <= current_capacity:
-          goes = not goes
-          
-      if (goes):
+      # packbits stores the lowest capacity in the most significant bit
+      bit = (decisions[item.index, current_capacity >> 3] >> (7 - (current_capacity & 7))) & 1
+      if bit:
         taken[item.index] = 1
         current_capacity -= item.weight
         acc_value += item.value
-    
-    
+
     assert acc_value == total_value
 
-    # prepare the solution in the specified output format
-    output_data = str(total_value) + ' ' + str(1) + '\n'
+    return (total_value, taken)
+
+
+def dp_column(items, capacity, check=None):
+    # best value for every capacity using only the given items. The column
+    # is updated in place block by block from the top, so a block only reads
+    # capacities below it that this item has not updated yet
+    col = numpy.zeros(capacity+1, dtype=numpy.int64)
+    for item in items:
+      if check is not None:
+        check()
+      if item.weight > capacity:
+        continue
+      high = capacity+1
+      while high > item.weight:
+        low = max(high - COLUMN_BLOCK, item.weight)
+        numpy.maximum(col[low:high], col[low-item.weight:high-item.weight] + item.value, out=col[low:high])
+        high = low
+    return col
+
+
+def solve_dp_low_memory(items, capacity, check=None):
+    # divide and conquer reconstruction (Hirschberg style): the items are split
+    # in two halves, a DP column is computed for each one and the capacity is
+    # divided where both halves add up to the optimum. Each half is then solved
+    # recursively, so only two columns are alive at any time. check() is
+    # called once per item and column to stop the search (by raising).
+
+    taken = [0]*len(items)
+
+    def split(subset, capacity):
+      if capacity == 0 or len(subset) == 0:
+        return
+
+      if len(subset) == 1:
+        if subset[0].weight <= capacity:
+          taken[subset[0].index] = 1
+        return
+
+      if len(subset) * (capacity+1) <= LOW_MEMORY_LEAF_CELLS:
+        (value, leaf_taken) = solve_dp([Item(i, item.value, item.weight) for (i, item) in enumerate(subset)], capacity)
+        for i in range(len(subset)):
+          if leaf_taken[i]:
+            taken[subset[i].index] = 1
+        return
+
+      middle = len(subset) / 2
+      left = subset[:middle]
+      right = subset[middle:]
+
+      left_col = dp_column(left, capacity, check)
+      right_col = dp_column(right, capacity, check)
+      numpy.add(left_col, right_col[::-1], out=left_col)
+      left_capacity = int(numpy.argmax(left_col))
+      left_col = None
+      right_col = None
+
+      split(left, left_capacity)
+      split(right, capacity - left_capacity)
+
+    split(items, capacity)
+
+    total_value = sum([item.value for item in items if taken[item.index]])
+    assert sum([item.weight for item in items if taken[item.index]]) <= capacity
+
+    return (total_value, taken)
+
+
+def solve_bb(items, capacity, on_improve=None, check=None, lower=0):
+    # depth first branch and bound over the items sorted by value density,
+    # pruning with the fractional (Dantzig) relaxation of the remaining items
+    # against the best value so far, starting from a known lower bound;
+    # every better solution met on the way is handed to on_improve, and
+    # check() is called now and then to stop the search (by raising). When
+    # nothing beats the lower bound the empty solution is returned.
+
+    order = sorted([item for item in items if item.weight <= capacity], key=lambda item: -float(item.value) / item.weight)
+    n = len(order)
+
+    values = array.array('l', [item.value for item in order])
+    weights = array.array('l', [item.weight for item in order])
+
+    # prefix sums let the relaxation find its critical item with a bisection
+    prefix_values = array.array('l', [0]*(n+1))
+    prefix_weights = array.array('l', [0]*(n+1))
+    for i in range(n):
+      prefix_values[i+1] = prefix_values[i] + values[i]
+      prefix_weights[i+1] = prefix_weights[i] + weights[i]
+
+    def bound(i, value, room):
+      k = bisect_right(prefix_weights, prefix_weights[i] + room) - 1
+      value += prefix_values[k] - prefix_values[i]
+      if k < n:
+        room -= prefix_weights[k] - prefix_weights[i]
+        value += room * values[k] / weights[k]
+      return value
+
+    def unsort(decisions):
+      taken = [0]*len(items)
+      for i in range(n):
+        if decisions[i]:
+          taken[order[i].index] = 1
+      return taken
+
+    best_value = lower
+    best_taken = array.array('b', [0]*n)
+    current = array.array('b', [0]*n)
+
+    # every node is (depth, value, room, decision taken for depth-1); as the
+    # search is depth first, current[:depth] always holds the node's path
+    stack = [(0, 0, capacity, 0)]
+    visited = 0
+
+    while stack:
+      visited += 1
+      if check is not None and visited % CLOCK_INTERVAL == 0:
+        check()
+
+      (i, value, room, goes) = stack.pop()
+      if i > 0:
+        current[i-1] = goes
+
+      if value > best_value:
+        best_value = value
+        best_taken = current[:i] + array.array('b', [0]*(n-i))
+        if on_improve is not None:
+          on_improve(best_value, unsort(best_taken))
+
+      if i == n or bound(i, value, room) <= best_value:
+        continue
+
+      stack.append((i+1, value, room, 0))
+      if weights[i] <= room:
+        stack.append((i+1, value + values[i], room - weights[i], 1))
+
+    return (sum([values[i] for i in range(n) if best_taken[i]]), unsort(best_taken))
+
+
+def remove_dominated(items, capacity):
+    # an item is dropped when lighter and more valuable items exist whose
+    # weight together with its own exceeds the capacity: any solution with it
+    # then leaves one of them out and can swap them without losing value.
+    # Items are visited from the strongest to the weakest so that every
+    # removal is justified only by items that are kept.
+
+    order = sorted(items, key=lambda item: (item.weight, -item.value))
+    ranks = dict([(value, rank+1) for (rank, value) in enumerate(sorted(set([item.value for item in items]), reverse=True))])
+
+    # fenwick tree over the value ranks holding the weight of the kept items
+    tree = array.array('l', [0]*(len(ranks)+1))
+
+    kept = []
+    for item in order:
+      rank = ranks[item.value]
+
+      dominating_weight = 0
+      i = rank
+      while i > 0:
+        dominating_weight += tree[i]
+        i -= i & -i
+
+      if dominating_weight + item.weight > capacity:
+        continue
+
+      kept.append(item)
+      i = rank
+      while i < len(tree):
+        tree[i] += item.weight
+        i += i & -i
+
+    return sorted(kept, key=lambda item: item.index)
+
+
+def greedy_bounds(items, capacity):
+    # greedy lower bound (incumbent) plus, for every item, the Dantzig upper
+    # bound with the item forced out and forced in
+
+    order = sorted(items, key=lambda item: -float(item.value) / item.weight)
+    n = len(order)
+
+    prefix_values = [0]*(n+1)
+    prefix_weights = [0]*(n+1)
+    for i in range(n):
+      prefix_values[i+1] = prefix_values[i] + order[i].value
+      prefix_weights[i+1] = prefix_weights[i] + order[i].weight
+
+    def relaxation(room, skip):
+      # fractional fill over all the items except order[skip]
+      if prefix_weights[skip] > room:
+        k = bisect_right(prefix_weights, room) - 1
+        value = prefix_values[k]
+        room -= prefix_weights[k]
+      else:
+        k = max(bisect_right(prefix_weights, room + order[skip].weight) - 1, skip+1)
+        value = prefix_values[k] - order[skip].value
+        room += order[skip].weight - prefix_weights[k]
+      if k < n:
+        value += room * order[k].value / order[k].weight
+      return value
+
+    incumbent = []
+    lower = 0
+    room = capacity
+    for item in order:
+      if item.weight <= room:
+        incumbent.append(item)
+        lower += item.value
+        room -= item.weight
+
+    upper_out = {}
+    upper_in = {}
+    for i in range(n):
+      item = order[i]
+      upper_out[item.index] = relaxation(capacity, i)
+      upper_in[item.index] = item.value + relaxation(capacity - item.weight, i)
+
+    return (lower, incumbent, upper_out, upper_in)
+
+
+def reduce_instance(items, capacity):
+    # shrinks the instance before the solver runs. Items too heavy or dominated
+    # are dropped, items whose bounds cannot beat the greedy solution are fixed
+    # in or out, and weights and capacity are divided by their gcd. The greedy
+    # solution is kept as incumbent, since fixing may only discard solutions
+    # that are not better than it.
+
+    items = [item for item in items if item.weight <= capacity]
+    items = remove_dominated(items, capacity)
+
+    (lower, incumbent, upper_out, upper_in) = greedy_bounds(items, capacity)
+
+    fixed = []
+    free = []
+    for item in items:
+      if upper_out[item.index] <= lower:
+        fixed.append(item)
+      elif upper_in[item.index] > lower:
+        free.append(item)
+
+    room = capacity - sum([item.weight for item in fixed])
+    if room < 0:
+      # the fixings contradict each other, only when greedy is already optimal
+      return Reduction([], 0, [], [], incumbent)
+
+    free = [item for item in free if item.weight <= room]
+
+    divisor = reduce(gcd, [item.weight for item in free], room) or 1
+
+    reduced = [Item(i, item.value, item.weight / divisor) for (i, item) in enumerate(free)]
+    return Reduction(reduced, room / divisor, [item.index for item in free], fixed, incumbent)
+
+
+def expand_solution(reduction, item_count, reduced_value, reduced_taken):
+    # maps the reduced solution back to the original indices, falling back
+    # to the incumbent when it is better
+    fixed_value = sum([item.value for item in reduction.fixed])
+    incumbent_value = sum([item.value for item in reduction.incumbent])
+
+    taken = [0]*item_count
+    if reduced_value + fixed_value < incumbent_value:
+      for item in reduction.incumbent:
+        taken[item.index] = 1
+      return (incumbent_value, taken)
+
+    for item in reduction.fixed:
+      taken[item.index] = 1
+    for i in range(len(reduced_taken)):
+      if reduced_taken[i]:
+        taken[reduction.original[i]] = 1
+    return (reduced_value + fixed_value, taken)
+
+
+def solve_knapsack(items, capacity, low_memory=False, on_improve=None, check=None, lower=0):
+    # the bit table when it fits (unless low_memory asks otherwise), then the
+    # low memory DP, which proves the big capacities within its own limits,
+    # and branch and bound beyond them
+    cells = len(items) * (capacity+1)
+    if cells <= DP_MAX_CELLS and not low_memory:
+      print "Engine: dp"
+      return solve_dp(items, capacity)
+
+    if capacity <= LOW_MEMORY_MAX_CAPACITY and cells <= LOW_MEMORY_MAX_CELLS:
+      print "Engine: low memory dp"
+      return solve_dp_low_memory(items, capacity, check)
+
+    print "Engine: branch and bound"
+    return solve_bb(items, capacity, on_improve, check, lower)
+
+
+def format_output(value, taken, optimal=False):
+    output_data = str(value) + ' ' + str(1 if optimal else 0) + '\n'
     output_data += ' '.join(map(str, taken))
     return output_data
 
 
+def solve_it(input_data, low_memory=False):
+    # Modify this code to run your optimization algorithm
+
+    # parse the input
+    problem = instance.parse(input_data, 'knapsack')
+
+    item_count = len(problem.values)
+    capacity = problem.capacity
+    
+    print "Capacity: "
+    print capacity
+    print "Items: "
+    print item_count
+
+    items = [Item(i, value, weight) for (i, (value, weight)) in enumerate(zip(problem.values.tolist(), problem.weights.tolist()))]
+    
+    reduction = reduce_instance(items, capacity)
+    print "Reduced to %d items, capacity %d (%d fixed in)" % (len(reduction.items), reduction.capacity, len(reduction.fixed))
+
+    driver = anytime.Anytime(TIME_LIMIT, CHECKPOINT, format_output, maximize=True)
+    proven = []
+
+    def offer(reduced_value, reduced_taken):
+        driver.offer(*expand_solution(reduction, item_count, reduced_value, reduced_taken))
+
+    def construct_phase(seconds):
+        # the greedy solution the reduction started from
+        taken = [0]*item_count
+        for item in reduction.incumbent:
+            taken[item.index] = 1
+        driver.offer(sum([item.value for item in reduction.incumbent]), taken)
+
+    def prove_phase(seconds):
+        # branch and bound only has to beat the greedy incumbent
+        lower = sum([item.value for item in reduction.incumbent]) - sum([item.value for item in reduction.fixed])
+        offer(*solve_knapsack(reduction.items, reduction.capacity, low_memory, offer, driver.check, lower))
+        proven.append(True)
+
+    (total_value, taken) = driver.run([
+        ('construct', 0.0, construct_phase),
+        ('prove', 1.0, prove_phase),
+    ])
+
+    # prepare the solution in the specified output format, optimal only when
+    # the search ran to the end
+    return format_output(total_value, taken, len(proven) > 0)
+
+
 import sys
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
-        print solve_it(input_data)
+        input_data = instance.load(file_location, 'knapsack')
+        print solve_it(input_data, '--low-memory' in sys.argv[2:])
     else:
-        print 'This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/ks_4_0)'
+        print 'This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/ks_4_0 [--low-memory])'
 
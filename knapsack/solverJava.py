@@ -2,37 +2,164 @@
 # -*- coding: utf-8 -*-
 
 import os
+import atexit
+import Queue
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from subprocess import Popen, PIPE
+import solver
+
+SOLVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# instances with at least this many (item, capacity) cells are sent to the
+# java workers; smaller ones are not worth the round trip and are solved by
+# the python solver
+JAVA_MIN_CELLS = 10000000
+
+
+class JavaWorker:
+    # a long lived `java Solver -worker` process. Instances are sent through
+    # its stdin and solutions read back from its stdout, each one prefixed by
+    # a line with its length in bytes.
+
+    def __init__(self):
+        self._process = Popen(['java', '-cp', SOLVER_DIR, 'Solver', '-worker'], stdin=PIPE, stdout=PIPE)
+
+    def solve(self, input_data):
+        if isinstance(input_data, unicode):
+            input_data = input_data.encode('ascii')
+
+        self._process.stdin.write('%d\n' % len(input_data))
+        self._process.stdin.write(input_data)
+        self._process.stdin.flush()
+
+        header = self._process.stdout.readline()
+        if not header:
+            raise IOError('java worker exited with code %s' % self._process.poll())
+
+        size = int(header)
+        output_data = self._process.stdout.read(size)
+        if len(output_data) != size:
+            raise IOError('java worker sent %d of %d bytes' % (len(output_data), size))
+        return output_data.strip()
+
+    def alive(self):
+        return self._process.poll() is None
+
+    def close(self):
+        self._process.stdin.close()
+        self._process.wait()
+
+    def kill(self):
+        # for a worker left in an unknown state, whose output can't be trusted
+        if self.alive():
+            self._process.kill()
+        self._process.wait()
 
-def solve_it(input_data):
 
-    # Writes the inputData to a temporay file
+class WorkerPool:
+    # up to `size` java workers shared by concurrent callers. Workers are
+    # started when a job finds none idle, and one that failed is killed
+    # rather than put back, the next job starting a fresh one.
 
-    tmp_file_name = 'tmp.data'
-    tmp_file = open(tmp_file_name, 'w')
-    tmp_file.write(input_data)
-    tmp_file.close()
+    def __init__(self, size):
+        self._size = size
+        self._workers = []
+        self._idle = Queue.Queue()
+        self._lock = threading.Lock()
 
-    # Runs the command: java Solver -file=tmp.data
+    def _take(self):
+        while True:
+            with self._lock:
+                if self._idle.empty() and len(self._workers) < self._size:
+                    worker = JavaWorker()
+                    self._workers.append(worker)
+                    return worker
+            worker = self._idle.get()
+            # None marks the slot of a discarded worker, free again
+            if worker is not None:
+                if worker.alive():
+                    return worker
+                self._discard(worker)
 
-    process = Popen(['java', 'Solver', '-file=' + tmp_file_name], stdout=PIPE)
-    (stdout, stderr) = process.communicate()
+    def _discard(self, worker):
+        with self._lock:
+            self._workers.remove(worker)
+        worker.kill()
+        self._idle.put(None)
 
-    # removes the temporay file
-    os.remove(tmp_file_name)
+    def solve(self, input_data):
+        worker = self._take()
+        try:
+            output_data = worker.solve(input_data)
+        except:
+            self._discard(worker)
+            raise
+        self._idle.put(worker)
+        return output_data
 
-    return stdout.strip()
+    def solve_many(self, inputs):
+        threads = ThreadPool(self._size)
+        try:
+            return threads.map(self.solve, inputs)
+        finally:
+            threads.close()
+
+    def close(self):
+        for worker in list(self._workers):
+            worker.close()
+
+
+_pool = None
+
+def get_pool(size=None):
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool(size or multiprocessing.cpu_count())
+        atexit.register(_pool.close)
+    return _pool
+
+
+def cells(input_data):
+    # (item, capacity) cells of the instance, from its first line
+    first_line = input_data.lstrip().split('\n', 1)[0].split()
+    return int(first_line[0]) * (int(first_line[1]) + 1)
+
+
+def solve_it(input_data):
+    if cells(input_data) < JAVA_MIN_CELLS:
+        return solver.solve_it(input_data)
+    return get_pool().solve(input_data)
+
+
+def solve_many(inputs):
+    # the big instances go to the java workers while the small ones are
+    # solved in python
+    big = [i for i in range(len(inputs)) if cells(inputs[i]) >= JAVA_MIN_CELLS]
+    solutions = [None]*len(inputs)
+    threads = ThreadPool(1)
+    try:
+        pending = threads.apply_async(get_pool().solve_many, ([inputs[i] for i in big],))
+        for i in sorted(set(range(len(inputs))) - set(big)):
+            solutions[i] = solver.solve_it(inputs[i])
+        for (i, solution) in zip(big, pending.get()):
+            solutions[i] = solution
+    finally:
+        threads.close()
+    return solutions
 
 
 import sys
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
-        file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
-        print solve_it(input_data)
+        inputs = []
+        for file_location in sys.argv[1:]:
+            input_data_file = open(file_location.strip(), 'r')
+            inputs.append(''.join(input_data_file.readlines()))
+            input_data_file.close()
+        for solution in solve_many(inputs):
+            print solution
     else:
         print 'This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/ks_4_0)'
-
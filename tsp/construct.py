@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Fast starting tours for the local search.
+#
+#   hilbert: visits the points in the order of a Hilbert curve laid over
+#            their bounding box, O(n log n) and fully vectorized
+#   greedy:  greedy edge matching, the shortest candidate edges (nearest
+#            neighbours) are taken while no city gets a third edge and no
+#            cycle closes early; the ends of the fragments are then matched
+#            the same way through the spatial grid until a single path is
+#            left
+#
+# Neither is a good tour by itself, they are meant as a start for 2-opt /
+# Or-opt and Lin-Kernighan.
+
+import numpy
+
+from common import spatial
+
+# bits per coordinate of the Hilbert curve grid
+HILBERT_ORDER = 16
+
+NEIGHBOURS = 10
+
+
+def hilbert_keys(xs, ys, order=HILBERT_ORDER):
+    # distance along the Hilbert curve of every point
+    side = 1 << order
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    ys = numpy.asarray(ys, dtype=numpy.float64)
+    span = max(xs.max() - xs.min(), ys.max() - ys.min(), 1e-9)
+    x = ((xs - xs.min()) / span * (side - 1)).astype(numpy.int64)
+    y = ((ys - ys.min()) / span * (side - 1)).astype(numpy.int64)
+
+    keys = numpy.zeros(len(x), dtype=numpy.int64)
+    s = side / 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        x = numpy.where(flip, side - 1 - x, x)
+        y = numpy.where(flip, side - 1 - y, y)
+        swap = ~ry
+        (x, y) = (numpy.where(swap, y, x), numpy.where(swap, x, y))
+        s /= 2
+    return keys
+
+
+def hilbert(xs, ys):
+    return numpy.argsort(hilbert_keys(xs, ys), kind='mergesort').tolist()
+
+
+def greedy(distances, k=NEIGHBOURS):
+    n = len(distances._points)
+    if n < 3:
+        return range(n)
+
+    degree = [0]*n
+    links = [[] for i in range(n)]
+    parent = range(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def match(ids, neighbours, lengths):
+        # takes the candidate edges shortest first, each one once; an edge in
+        # the lists of both its ends is kept once, one in only one list too
+        a = numpy.repeat(ids, neighbours.shape[1])
+        b = ids[neighbours.ravel()]
+        (keys, once) = numpy.unique(numpy.minimum(a, b) * n + numpy.maximum(a, b), return_index=True)
+        order = numpy.argsort(lengths.ravel()[once], kind='mergesort')
+        added = 0
+        for (i, j) in zip(a[once][order].tolist(), b[once][order].tolist()):
+            if degree[i] == 2 or degree[j] == 2:
+                continue
+            (ri, rj) = (find(i), find(j))
+            if ri == rj:
+                continue
+            parent[ri] = rj
+            degree[i] += 1
+            degree[j] += 1
+            links[i].append(j)
+            links[j].append(i)
+            added += 1
+        return added
+
+    (neighbours, lengths) = distances.neighbours(k)
+    match(numpy.arange(n), neighbours, lengths)
+
+    # then the same among the ends of the fragments, while that joins some
+    while True:
+        ends = numpy.array([city for city in range(n) if degree[city] < 2])
+        if len(ends) <= 2:
+            break
+        grid = spatial.Grid(distances._x[ends], distances._y[ends])
+        (neighbours, lengths) = grid.all_nearest(k)
+        if match(ends, neighbours, lengths) == 0:
+            break
+
+    # walk every fragment from one of its ends, single cities included
+    keys = hilbert_keys(distances._x, distances._y).tolist()
+    seen = [False]*n
+    fragments = []
+    for city in range(n):
+        if seen[city] or degree[city] == 2:
+            continue
+        fragment = [city]
+        seen[city] = True
+        previous = -1
+        current = city
+        while True:
+            following = [c for c in links[current] if c != previous]
+            if not following:
+                break
+            (previous, current) = (current, following[0])
+            fragment.append(current)
+            seen[current] = True
+        fragments.append(fragment)
+
+    # chain whatever is left along the curve, each fragment entered at the
+    # end that comes first on it
+    fragments.sort(key=lambda f: min(keys[f[0]], keys[f[-1]]))
+    solution = []
+    for fragment in fragments:
+        if keys[fragment[-1]] < keys[fragment[0]]:
+            fragment.reverse()
+        solution.extend(fragment)
+    return solution
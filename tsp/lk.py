@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# Lin-Kernighan style improvement built on sequential 2-opt moves. From a
+# tour edge (t1, t2) the step keeps breaking the edge that closes the chain
+# and reconnecting to one of the candidates (nearest neighbours) of its free
+# end, as long as the partial gain stays positive and the depth is under the
+# cap. The best closed tour found along the chain is kept, the rest of the
+# moves are undone. Once no chain improves the tour it is kicked with a
+# random local double bridge and the search restarts, keeping the best tour.
+
+import math
+import time
+import random
+import array
+from collections import deque
+
+from tour import ArrayTour, TwoLevelTour, CostedTour
+
+NEIGHBOURS = 8
+MAX_DEPTH = 12
+EPSILON = 1e-7
+
+# from this many cities on the tour is kept as a two level list
+TWO_LEVEL_MIN_NODES = 10000
+
+# the four cut points of a kick are taken within this many positions
+KICK_WINDOW = 50
+
+
+def improve(distances, solution, time_limit, k=NEIGHBOURS, max_depth=MAX_DEPTH, restarts=True, seed=None, verify=False):
+    # returns (obj, solution) with obj in the scaled units of `distances`;
+    # with verify the tracked length is checked against a full recompute
+    # after every move
+    deadline = time.time() + time_limit
+    n = len(solution)
+    if n < 8:
+        return (distances.obj(solution), list(solution))
+
+    xs = distances._x.tolist()
+    ys = distances._y.tolist()
+
+    def dist(a, b):
+        return math.hypot(xs[a] - xs[b], ys[a] - ys[b])
+
+    neighbours = distances.neighbours(k)[0].tolist()
+    rand = random.Random(seed)
+    tour_class = TwoLevelTour if n >= TWO_LEVEL_MIN_NODES else ArrayTour
+
+    def step(tour, t1, t2):
+        # one variable depth chain starting by breaking (t1, t2), returns
+        # True when the tour was improved
+        forward = tour.next(t1) == t2
+        gain = dist(t1, t2)
+        best_gain = EPSILON
+        best_depth = 0
+        moves = []
+        added = set()
+
+        for depth in range(max_depth):
+            choice = None
+            for t3 in neighbours[t2]:
+                g1 = gain - dist(t2, t3)
+                if g1 <= 0:
+                    break
+                if t3 == t1:
+                    continue
+                t4 = tour.prev(t3) if forward else tour.next(t3)
+                if t4 == t2 or (min(t3, t4), max(t3, t4)) in added:
+                    continue
+                value = g1 + dist(t3, t4)
+                if choice is None or value > choice[0]:
+                    choice = (value, t3, t4)
+            if choice is None:
+                break
+
+            (gain, t3, t4) = choice
+            if forward:
+                tour.move(t1, t2, t4, t3)
+                moves.append((t1, t2, t4, t3))
+            else:
+                tour.move(t2, t1, t3, t4)
+                moves.append((t2, t1, t3, t4))
+            added.add((min(t2, t3), max(t2, t3)))
+
+            closing = gain - dist(t4, t1)
+            if closing > best_gain:
+                best_gain = closing
+                best_depth = len(moves)
+
+            t2 = t4
+            forward = tour.next(t1) == t2
+
+        # undo the moves past the best closed tour
+        while len(moves) > best_depth:
+            (a, b, c, d) = moves.pop()
+            tour.move(a, c, b, d)
+        return best_depth > 0
+
+    def optimize(tour, cities):
+        queue = deque(cities)
+        active = array.array('b', [0]*n)
+        for city in cities:
+            active[city] = 1
+        while queue and time.time() < deadline:
+            t1 = queue.popleft()
+            active[t1] = 0
+            for t2 in (tour.next(t1), tour.prev(t1)):
+                if step(tour, t1, t2):
+                    for city in (t1, t2, tour.next(t1), tour.prev(t1)):
+                        if not active[city]:
+                            active[city] = 1
+                            queue.append(city)
+                    break
+
+    def kick(cities):
+        # random double bridge on four nearby positions: A B C D -> A C B D,
+        # returns the new tour, the cities at the ends of the new edges and
+        # the change in length, scaled
+        start = rand.randrange(n)
+        cities = cities[start:] + cities[:start]
+        window = min(KICK_WINDOW, n - 1)
+        (i, j, l) = sorted(rand.sample(range(1, window + 1), 3))
+        ends = [cities[0], cities[i-1], cities[i], cities[j-1], cities[j], cities[l-1], cities[l % n], cities[-1]]
+        delta = (dist(cities[i-1], cities[j]) + dist(cities[l-1], cities[i]) + dist(cities[j-1], cities[l % n])
+                 - dist(cities[i-1], cities[i]) - dist(cities[j-1], cities[j]) - dist(cities[l-1], cities[l % n]))
+        return (cities[:i] + cities[j:l] + cities[i:j] + cities[l:], ends, delta * distances._scale)
+
+    tour = CostedTour(tour_class(solution), distances, verify=verify)
+    optimize(tour, solution)
+    best = tour.cities()
+    best_obj = tour.length
+
+    while restarts and time.time() < deadline:
+        (kicked, ends, delta) = kick(best)
+        tour = CostedTour(tour_class(kicked), distances, best_obj + delta, verify)
+        optimize(tour, ends)
+        if tour.length < best_obj:
+            best = tour.cities()
+            best_obj = tour.length
+
+    return (best_obj, best)
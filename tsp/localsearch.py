@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# 2-opt and Or-opt improvement of a closed tour. The tour is kept as a
+# position indexed array (tour[position] = city, position[city] = position),
+# or as a two level list for the big instances, see tour.py. Moves are only
+# tried towards the k nearest neighbours of a city and cities whose
+# neighbourhood did not change are skipped (don't look bits), so a pass costs
+# about O(n*k) instead of O(n^2).
+
+import math
+import time
+import array
+from collections import deque
+
+from tour import ArrayTour, TwoLevelTour, CostedTour, insert_segment
+
+NEIGHBOURS = 10
+OR_OPT_SEGMENT = 3
+EPSILON = 1e-7
+
+# from this many cities on segment reversals go through the two level list
+TWO_LEVEL_MIN_NODES = 10000
+
+# how many cities are examined between two looks at the clock
+CLOCK_INTERVAL = 100
+
+
+def improve(distances, solution, time_limit, k=NEIGHBOURS, verify=False):
+    # runs 2-opt and Or-opt moves until no city improves or the time is up,
+    # returns (obj, solution) with obj in the scaled units of `distances`;
+    # with verify the tracked length is checked against a full recompute
+    # after every move
+    deadline = time.time() + time_limit
+    n = len(solution)
+    if n < 5:
+        return (distances.obj(solution), list(solution))
+
+    xs = distances._x.tolist()
+    ys = distances._y.tolist()
+
+    def dist(a, b):
+        return math.hypot(xs[a] - xs[b], ys[a] - ys[b])
+
+    neighbours = distances.neighbours(k)[0].tolist()
+    tour = TwoLevelTour(solution) if n >= TWO_LEVEL_MIN_NODES else ArrayTour(solution)
+    tour = CostedTour(tour, distances, verify=verify)
+
+    queue = deque(solution)
+    active = array.array('b', [1]*n)
+
+    def wake(*cities):
+        for city in cities:
+            if not active[city]:
+                active[city] = 1
+                queue.append(city)
+
+    def two_opt(a):
+        for forward in (True, False):
+            b = tour.next(a) if forward else tour.prev(a)
+            d_ab = dist(a, b)
+            for c in neighbours[a]:
+                d_ac = dist(a, c)
+                if d_ac >= d_ab:
+                    break
+                d = tour.next(c) if forward else tour.prev(c)
+                if d == a or c == b:
+                    continue
+                delta = d_ac + dist(b, d) - d_ab - dist(c, d)
+                if delta < -EPSILON:
+                    if forward:
+                        tour.move(a, b, c, d)
+                    else:
+                        tour.move(b, a, d, c)
+                    wake(a, b, c, d)
+                    return True
+        return False
+
+    def or_opt(a):
+        s2 = a
+        for length in range(1, OR_OPT_SEGMENT + 1):
+            if length > 1:
+                s2 = tour.next(s2)
+            s1 = a
+            p = tour.prev(s1)
+            nx = tour.next(s2)
+            if p == s2 or nx == s1 or p == nx:
+                return False
+
+            removed = dist(p, s1) + dist(s2, nx) - dist(p, nx)
+            for end in (s1, s2):
+                for c in neighbours[end]:
+                    if c == p or tour.between(s1, c, s2):
+                        continue
+                    d = tour.next(c)
+                    if d == p:
+                        continue
+                    straight = dist(c, s1) + dist(s2, d)
+                    reversed_ = dist(c, s2) + dist(s1, d)
+                    delta = min(straight, reversed_) - dist(c, d) - removed
+                    if delta < -EPSILON:
+                        insert_segment(tour, s1, s2, c, d, straight < reversed_)
+                        wake(p, nx, c, d, s1, s2)
+                        return True
+        return False
+
+    steps = 0
+    while queue:
+        steps += 1
+        if steps % CLOCK_INTERVAL == 0 and time.time() > deadline:
+            break
+        a = queue.popleft()
+        active[a] = 0
+        if two_opt(a) or or_opt(a):
+            wake(a)
+
+    return (tour.length, tour.cities())
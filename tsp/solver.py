@@ -1,194 +1,145 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import math
-import array
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import instance
+from common.distance import DistanceMatrix, ONDEMAND
+from common import routing as routing_costs
+from common import spatial
+import localsearch
+import lk
+import construct
+import stitch
+import time
+import numpy
+import hashlib
+import multiprocessing
 from collections import namedtuple
-from collections import deque
 from ortools.constraint_solver import pywrapcp
 from ortools.linear_solver import pywraplp
 
 Point = namedtuple("Point", ['id', 'x', 'y'])
-Segment = namedtuple("Segment", ['f', 't', 'id'])
-Rect = namedtuple("Rect", ['x0', 'y0', 'x1', 'y1'])
 
-class DistanceMatrix:
-    
-    def __init__(self, points):
-        self._points = points
-        #l = len(points)
-        #self._distances = array.array('I', [65535] * range(l*(l+1)/2))
+# seconds of 2-opt / Or-opt run on the tour found by the solver
+LOCAL_SEARCH_TIME = 60
 
-    def _distance(self, i,j):
-        return self._distanceP(self._points[i], self._points[j])
-    
-    def _distanceP(p0, p1):
-        return math.sqrt((p0.x - p1.x)**2 + (p0.y - p1.y)**2) * 100
-
-    def _distanceBuffered(self, i, j):
-        if (j > i):
-            i,j = j,i
-        k = (i * (i + 1) / 2) + j        
-        l = self._distances[k]
-        if l == 65535:
-            l = self._distance(i,j)
-            self._distances[k] = l
-        return l
-
-    def get(self, i, j):
-        return self._distance(i,j)    
-
-
-    def obj(self, solution):
-        return sum([self._distanceP(s[0],s[1]) for s in segmentize(self._points)])
-
-def make_clusters(points):
-    body = [[] for i in range(21)]
-    left = []
-    right = []    
-    for point in points:
-        if point.y > 15000 and point.y < 590000 and (point.x < 55000 or point.x > 620000):
-            if point.x < 55000:
-                left.append(point)
-            else:
-                right.append(point)
-        else:
-            body[int(point.y / 30000)].append(point)
-    return (left, body, right)
-
-def connection_cost(from_, to, cross, distances):
-    savings = distances.get(from_[0], from_[1]) + distances.get(to[0], to[1])
-    cost = distances.get(from_[1 if cross else 0], to[0]) + distances.get(from_[0 if cross else 1], to[1])
-    return cost - savings
-
-def shift_and_reverse(what, shift, reverse):
-    d = deque(what)
-    d.rotate(len(what) - shift - 1)
-    if reverse:
-        d.reverse()
-    return d
-
-def containing_rect(points):
-    x0 = points[0].x
-    y0 = points[0].y
-    x1 = x0
-    y1 = y0
-
-    for p in points:
-        if p.x < x0:
-            x0 = p.x
-        if p.y < y0:
-            y0 = p.y
-        if p.x > x1:
-            x1 = p.x
-        if p.y > y1:
-            y1 = p.y
-
-    dy = 1000
-    dx = 60000
-
-    return Rect(x0-dx, y0-dy, x1+dx, y1+dy)
-
-def segmentize(points):
-    l = len(points)
-    s = [Segment(points[i], points[i+1], i) for i in range(l - 1)]
-    s.append(Segment(points[-1], points[0], l))
-    return s    
-
-def in_rect(r, p):
-    return r.x0 <= p.x and r.y0 <= p.y and p.x <= r.x1 and p.y <= r.y1
-
-def choose_with_rect(r, segments, points):
-    result = []
-    while len(result) == 0:
-        for s in segments:
-            if in_rect(r, points[s[0]]) or in_rect(r, points[s[1]]):
-                result.append(s)
-        r = Rect(r.x0, r.y0 - 1000, r.x1, r.y1 + 1000)
-    print len(result)
-    return result
-
-def insert_solution(solution, partial, distances):
-
-    if len(solution) == 0:
-        solution.extend(partial)        
-        return
-
-    points = distances._points
-
-    rect = containing_rect([points[i] for i in partial])
-    print rect
-
-    segment_solution = segmentize(solution)
-    filtered_solution = choose_with_rect(rect, segment_solution, points)
-
-    segment_partial = segmentize(partial)
-
-    best_solution = segment_solution[0].id
-    best_partial = segment_partial[0].id
-    best_cross = False
-    best_cost = connection_cost(segment_solution[0], segment_partial[0], False, distances)
-
-    for s in filtered_solution:
-        for p in segment_partial:
-            for cross in (False, True):
-                cost = connection_cost(s, p, cross, distances)
-                if cost < best_cost:
-                    best_solution = s.id
-                    best_partial = p.id
-                    best_cross = cross
-                    best_cost = cost
-
-
-    solution[best_solution:best_solution] = shift_and_reverse(partial, best_partial, not best_cross) 
-
-
-def solve_and_save(cluster, filename):
-    l = len(cluster)
-    print filename, l
-    if l > 0:
-        (objective, solution) = solve_routing(cluster, l)
-        f = open(filename,'w')
-        for i in solution:
-            f.write(str(cluster[i].id) + "\n")
-        f.close()
+# engine building the tour, 'routing', 'lk', 'clustered' or 'construct', and
+# the seconds either one gets ('clustered' shares them out among the
+# clusters, see cluster_budgets; 'construct' takes well under a second)
+ENGINE = 'routing'
+SEARCH_TIME = 5 * 60
 
-def clusterize_and_save(points):
-    (left, body, right) = make_clusters(points) 
+# share of the 'lk' search time taken by the 2-opt / Or-opt pass before the
+# Lin-Kernighan chains, which get the rest
+LK_LOCAL_SEARCH_SHARE = 0.25
 
-    solve_and_save(left, "clusters/left")
-    solve_and_save(right, "clusters/right")
+# starting tour of 'lk' and 'construct', 'greedy' or 'hilbert'
+FIRST_SOLUTION = 'greedy'
 
-    _id = 0    
-    for cluster in body:
-        solve_and_save(cluster, "clusters/body_%d" % _id)
-        _id += 1
+# points per cluster when the instance is split before solving
+CLUSTER_SIZE = 1500
 
-def read_partial(name):
-    print name
-    return [int(line.strip()) for line in open(name)]
+# solved clusters are kept here, one file per content hash (see cluster_key);
+# bump the version when a change to the solver invalidates them
+CLUSTER_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clusters')
+CLUSTER_CACHE_VERSION = 1
 
-def solve_clustered(points, nodeCount):
-    #clusterize_and_save(points)
+def make_clusters(points, size=CLUSTER_SIZE):
+    clusters = spatial.split([p.x for p in points], [p.y for p in points], size)
+    return [[points[i] for i in ids] for ids in clusters]
 
-    dm = DistanceMatrix(points)
-    solution = []
+def solve_cluster(task):
+    # runs in a pool worker, returns the sub-tour in terms of the point ids
+    (cluster, time_limit) = task
+    l = len(cluster)
+    print "cluster", l, "points", time_limit, "seconds"
+    (objective, solution) = solve_routing(cluster, l, time_limit)
+    return [cluster[i].id for i in solution]
+
+def cluster_budgets(clusters, workers):
+    # seconds per cluster, proportional to its size, so that the pool is busy
+    # for about SEARCH_TIME overall
+    total = sum(len(cluster) for cluster in clusters)
+    return [max(SEARCH_TIME * min(workers, len(clusters)) * len(cluster) / total, 1) for cluster in clusters]
+
+def cluster_key(cluster):
+    # content address of a cluster sub-tour: its points and the configured
+    # search time. The seconds a cluster actually gets depend on the number
+    # of workers, so they are left out and a cached tour serves any machine;
+    # clusters are always solved by solve_routing, whatever ENGINE says
+    key = hashlib.sha1('%d:%s' % (CLUSTER_CACHE_VERSION, SEARCH_TIME))
+    key.update(numpy.array([p.id for p in cluster], dtype=numpy.int64).tostring())
+    key.update(numpy.array([(p.x, p.y) for p in cluster], dtype=numpy.float64).tostring())
+    return key.hexdigest()
+
+def read_cached(cluster, key):
+    try:
+        partial = [int(line) for line in open(os.path.join(CLUSTER_CACHE, key))]
+    except (IOError, ValueError):
+        return None
+    if sorted(partial) != sorted(p.id for p in cluster):
+        return None
+    return partial
+
+def write_cached(key, partial):
+    location = os.path.join(CLUSTER_CACHE, key)
+    try:
+        if not os.path.isdir(CLUSTER_CACHE):
+            os.makedirs(CLUSTER_CACHE)
+        f = open(location + '.tmp', 'w')
+        try:
+            f.write(''.join(str(i) + "\n" for i in partial))
+        finally:
+            f.close()
+        os.rename(location + '.tmp', location)
+    except (IOError, OSError):
+        pass
+
+def solve_clusters(clusters):
+    workers = min(multiprocessing.cpu_count(), len(clusters))
+    budgets = cluster_budgets(clusters, workers)
+    keys = [cluster_key(cluster) for cluster in clusters]
+
+    partials = [read_cached(cluster, key) for (cluster, key) in zip(clusters, keys)]
+    missing = [i for i in range(len(clusters)) if partials[i] is None]
+    print len(clusters) - len(missing), "of", len(clusters), "clusters cached"
+
+    tasks = [(clusters[i], budgets[i]) for i in missing]
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        solved = map(solve_cluster, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            solved = pool.map(solve_cluster, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    for (i, partial) in zip(missing, solved):
+        write_cached(keys[i], partial)
+        partials[i] = partial
+    return partials
 
-    for i in range(21):
-        partial = read_partial("clusters/body_%d" % i)
-        insert_solution(solution, partial, dm)
+def solve_clustered(points, nodeCount):
+    clusters = make_clusters(points)
+    partials = solve_clusters(clusters)
 
-    insert_solution(solution, read_partial("clusters/left"), dm)
-    insert_solution(solution, read_partial("clusters/right"), dm)
+    # stitching, like the local search, only needs coordinates and
+    # neighbours, never the full table
+    dm = DistanceMatrix(points, mode=ONDEMAND)
+    solution = stitch.stitch(dm, partials)
 
     return (dm.obj(solution), solution)
 
-def solve_routing(points, nodeCount):
+def solve_routing(points, nodeCount, time_limit=SEARCH_TIME):
 
     distanceMatrix = DistanceMatrix(points)
 
     routing = pywrapcp.RoutingModel(nodeCount, 1)
-    routing.UpdateTimeLimit(5 * 60000)
+    routing.UpdateTimeLimit(int(time_limit * 1000))
 
     parameters = pywrapcp.RoutingSearchParameters()
     # Setting first solution heuristic (cheapest addition).
@@ -200,14 +151,14 @@ def solve_routing(points, nodeCount):
     parameters.no_lns = True
     
 
-    cost = distanceMatrix.get
-
-    routing.SetCost(cost)
+    cost = routing_costs.set_cost(routing, distanceMatrix)
     
     #search_log = routing.solver().SearchLog(10000000, routing.CostVar())
     #routing.AddSearchMonitor(search_log)
 
+    routing_costs.report(routing, cost)
     assignment = routing.SolveWithParameters(parameters, None)
+    routing_costs.report(routing, cost)
 
     solution = []
 
@@ -218,6 +169,27 @@ def solve_routing(points, nodeCount):
 
     return (assignment.ObjectiveValue(), solution)
 
+def first_solution(distanceMatrix):
+    if FIRST_SOLUTION == 'hilbert':
+        return construct.hilbert(distanceMatrix._x, distanceMatrix._y)
+    return construct.greedy(distanceMatrix)
+
+def solve_construct(points, nodeCount):
+    distanceMatrix = DistanceMatrix(points, mode=ONDEMAND)
+    solution = first_solution(distanceMatrix)
+    return (distanceMatrix.obj(solution), solution)
+
+def solve_lk(points, nodeCount):
+
+    start = time.time()
+    distanceMatrix = DistanceMatrix(points, mode=ONDEMAND)
+
+    # 2-opt first, the Lin-Kernighan chains then start from a decent tour
+    (obj, solution) = localsearch.improve(distanceMatrix, first_solution(distanceMatrix), SEARCH_TIME * LK_LOCAL_SEARCH_SHARE)
+    print obj
+
+    return lk.improve(distanceMatrix, solution, max(SEARCH_TIME - (time.time() - start), 0))
+
 def solve_mip(distanceMatrix, nodeCount):
 
     solver = pywraplp.Solver('CP is fun!', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING);
@@ -280,24 +252,29 @@ def solve_it(input_data):
     print "reading file"
 
     # parse the input
-    lines = input_data.split('\n')
+    problem = instance.parse(input_data, 'tsp')
 
-    nodeCount = int(lines[0])
-
-    points = []
+    nodeCount = len(problem.x)
 
     print "converting"
-    _id = 0
-    for line in lines[1:-1]:
-        parts = line.split()
-        p = Point(_id, float(parts[0]), float(parts[1]))
-        points.append(p)
-        _id += 1
+    points = [Point(i, x, y) for (i, (x, y)) in enumerate(zip(problem.x.tolist(), problem.y.tolist()))]
 
     # build a trivial solution
     # visit the nodes in the order they appear in the file
-    print "calling solver"
-    (obj, solution) = solve_routing(points, nodeCount)
+    print "calling solver", ENGINE
+    if ENGINE == 'lk':
+        (obj, solution) = solve_lk(points, nodeCount)
+    elif ENGINE == 'clustered':
+        (obj, solution) = solve_clustered(points, nodeCount)
+    elif ENGINE == 'construct':
+        (obj, solution) = solve_construct(points, nodeCount)
+    else:
+        (obj, solution) = solve_routing(points, nodeCount)
+
+    print obj
+
+    print "improving"
+    (obj, solution) = localsearch.improve(DistanceMatrix(points, mode=ONDEMAND), solution, LOCAL_SEARCH_TIME)
 
     print obj
          
@@ -314,9 +291,7 @@ if __name__ == '__main__':
 
     if len(sys.argv) > 1:
         file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
+        input_data = instance.load(file_location, 'tsp')
         solution = solve_it(input_data)
         f = open("solution",'w')
         f.write(solution)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Joins the closed sub-tours of the clusters into one tour. The clusters are
+# linked in a cluster graph by the nearest neighbour edges that cross from
+# one to another; their visiting order is a small tour over that graph. Each
+# cluster is then opened at one of its tour edges, entered at one end and
+# left at the other, and the edges to cut are picked all at once with a
+# shortest path around the cycle of clusters. The sub-tours are finally
+# spliced in order in a single pass.
+
+import numpy
+
+NEIGHBOURS = 10
+
+# tour edges of a cluster considered for cutting it open
+CANDIDATE_CUTS = 10
+
+
+def cluster_costs(distances, labels, count):
+    # cost between every pair of clusters: the shortest neighbour edge going
+    # across when there is one, the distance between the centroids otherwise
+    (neighbours, lengths) = distances.neighbours(NEIGHBOURS)
+    x = distances._x
+    y = distances._y
+    sizes = numpy.bincount(labels, minlength=count).astype(numpy.float64)
+    cx = numpy.bincount(labels, weights=x, minlength=count) / sizes
+    cy = numpy.bincount(labels, weights=y, minlength=count) / sizes
+    costs = numpy.hypot(cx[:, None] - cx[None, :], cy[:, None] - cy[None, :]) * distances._scale
+
+    source = numpy.repeat(labels, neighbours.shape[1])
+    target = labels[neighbours.ravel()]
+    across = source != target
+    pairs = source[across] * count + target[across]
+    crossing = numpy.full(count * count, numpy.inf)
+    numpy.minimum.at(crossing, pairs, lengths.ravel()[across])
+    crossing = crossing.reshape((count, count))
+    crossing = numpy.minimum(crossing, crossing.T)
+    return (numpy.where(numpy.isinf(crossing), costs, crossing), cx, cy)
+
+
+def order_clusters(costs):
+    # nearest neighbour tour over the clusters polished with 2-opt
+    count = len(costs)
+    order = [0]
+    left = set(range(1, count))
+    while left:
+        last = order[-1]
+        following = min(left, key=lambda j: costs[last][j])
+        order.append(following)
+        left.remove(following)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(count - 1):
+            for j in range(i + 2, count if i > 0 else count - 1):
+                (a, b, c, d) = (order[i], order[i+1], order[j], order[(j+1) % count])
+                if costs[a][c] + costs[b][d] < costs[a][b] + costs[c][d] - 1e-9:
+                    order[i+1:j+1] = reversed(order[i+1:j+1])
+                    improved = True
+    return order
+
+
+def near(distances, labels, members, cluster, cx, cy):
+    # distance from every member to the given cluster: through a neighbour
+    # edge when one crosses over, else to the centroid of the cluster
+    (neighbours, lengths) = distances.neighbours(NEIGHBOURS)
+    hits = labels[neighbours[members]] == cluster
+    through = numpy.where(hits, lengths[members], numpy.inf).min(axis=1)
+    centroid = numpy.hypot(distances._x[members] - cx[cluster], distances._y[members] - cy[cluster]) * distances._scale
+    return numpy.where(numpy.isinf(through), centroid, through)
+
+
+def cut_states(distances, labels, partial, before, after, cx, cy):
+    # (entry, exit, length of the cut edge) for the most promising ways of
+    # opening the sub-tour, walked from entry all the way round to exit
+    members = numpy.asarray(partial)
+    following = numpy.roll(members, -1)
+    if len(members) == 1:
+        return (members, members, numpy.zeros(1))
+    to_before = near(distances, labels, members, before, cx, cy)
+    to_after = near(distances, labels, members, after, cx, cy)
+    x = distances._x
+    y = distances._y
+    cut = numpy.hypot(x[members] - x[following], y[members] - y[following]) * distances._scale
+
+    # cutting (a, b) either enters at b and leaves at a or the other way round
+    forward = numpy.roll(to_before, -1) + to_after - cut
+    backward = to_before + numpy.roll(to_after, -1) - cut
+    scores = numpy.concatenate([forward, backward])
+    entries = numpy.concatenate([following, members])
+    exits = numpy.concatenate([members, following])
+    if len(members) == 2:
+        # both edges are the same pair of cities
+        keep = numpy.array([0, 2])
+    else:
+        keep = numpy.argsort(scores, kind='mergesort')[:CANDIDATE_CUTS]
+    return (entries[keep], exits[keep], numpy.concatenate([cut, cut])[keep])
+
+
+def links(distances, exits, entries):
+    dx = distances._x[exits, None] - distances._x[None, entries]
+    dy = distances._y[exits, None] - distances._y[None, entries]
+    return numpy.hypot(dx, dy) * distances._scale
+
+
+def choose_cuts(distances, states):
+    # cheapest (links - cut edges) around the cycle of clusters, one state
+    # per cluster; tries every state of the first cluster as the start
+    count = len(states)
+    steps = [links(distances, states[i][1], states[(i+1) % count][0]) for i in range(count)]
+    best = None
+    for start in range(len(states[0][0])):
+        cost = numpy.full(len(states[0][0]), numpy.inf)
+        cost[start] = -states[0][2][start]
+        back = []
+        for i in range(1, count):
+            total = cost[:, None] + steps[i-1]
+            choice = total.argmin(axis=0)
+            back.append(choice)
+            cost = total[choice, numpy.arange(len(choice))] - states[i][2]
+        closing = cost + steps[-1][:, start]
+        last = int(closing.argmin())
+        if best is None or closing[last] < best[0]:
+            chosen = [last]
+            for choice in reversed(back):
+                chosen.append(int(choice[chosen[-1]]))
+            chosen.reverse()
+            chosen[0] = start
+            best = (closing[last], chosen)
+    return best[1]
+
+
+def walk(partial, entry, exit):
+    # the sub-tour from entry round to exit, entry and exit being adjacent
+    l = len(partial)
+    i = partial.index(entry)
+    if partial[(i - 1) % l] == exit:
+        return partial[i:] + partial[:i]
+    return partial[i::-1] + partial[:i:-1]
+
+
+def stitch(distances, partials):
+    partials = [list(partial) for partial in partials if len(partial) > 0]
+    count = len(partials)
+    if count <= 1:
+        return partials[0] if partials else []
+
+    labels = numpy.empty(len(distances._points), dtype=numpy.int64)
+    for (i, partial) in enumerate(partials):
+        labels[partial] = i
+
+    (costs, cx, cy) = cluster_costs(distances, labels, count)
+    order = order_clusters(costs.tolist())
+    states = [cut_states(distances, labels, partials[c], order[i-1], order[(i+1) % count], cx, cy)
+              for (i, c) in enumerate(order)]
+    cuts = choose_cuts(distances, states)
+
+    solution = []
+    for (i, c) in enumerate(order):
+        (entries, exits, lengths) = states[i]
+        solution.extend(walk(partials[c], int(entries[cuts[i]]), int(exits[cuts[i]])))
+    return solution
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+# Tour representations for the local search. Both support
+#
+#   next(c) / prev(c)   the neighbours of city c along the tour
+#   between(a, b, c)    whether b lies on the path going forward from a to c
+#   move(a, b, c, d)    the 2-opt move replacing edges (a, b) and (c, d) with
+#                       (a, c) and (b, d), b following a and d following c
+#
+# ArrayTour reverses the shorter side of a plain position array, O(n) per
+# move. TwoLevelTour splits the tour into about sqrt(n) blocks that can be
+# reversed as a whole with a flag, so a move costs O(sqrt(n)).
+#
+# insert_segment builds the Or-3opt segment insertion out of 2-opt moves, so
+# it works on either of them.
+#
+# CostedTour wraps either one and keeps the tour length up to date with the
+# O(1) delta of every move; the length is only computed in full once, or on
+# every move when verifying.
+
+import math
+import array
+
+# relative error tolerated between the tracked and the recomputed length
+VERIFY_TOLERANCE = 1e-6
+
+
+class ArrayTour:
+
+    def __init__(self, solution):
+        self.n = len(solution)
+        self.tour = array.array('i', solution)
+        self.position = array.array('i', [0]*self.n)
+        for (i, city) in enumerate(solution):
+            self.position[city] = i
+
+    def next(self, city):
+        return self.tour[(self.position[city] + 1) % self.n]
+
+    def prev(self, city):
+        return self.tour[(self.position[city] - 1) % self.n]
+
+    def between(self, a, b, c):
+        pa = self.position[a]
+        pb = self.position[b]
+        pc = self.position[c]
+        if pa <= pc:
+            return pa <= pb <= pc
+        return pb >= pa or pb <= pc
+
+    def _reverse(self, i, j):
+        # reverses the path between positions i and j going forward; the
+        # shorter of the path and its complement is the one actually flipped
+        n = self.n
+        inner = (j - i) % n + 1
+        if inner * 2 > n:
+            (i, j) = ((j + 1) % n, (i - 1) % n)
+            inner = n - inner
+        tour = self.tour
+        position = self.position
+        for k in range(inner / 2):
+            a = tour[i]
+            b = tour[j]
+            tour[i] = b
+            position[b] = i
+            tour[j] = a
+            position[a] = j
+            i = (i + 1) % n
+            j = (j - 1) % n
+
+    def move(self, a, b, c, d):
+        if self.next(a) == b:
+            self._reverse(self.position[b], self.position[c])
+        else:
+            self._reverse(self.position[c], self.position[b])
+
+    def cities(self):
+        return self.tour.tolist()
+
+
+class Block:
+
+    def __init__(self, cities):
+        self.cities = cities
+        self.reversed = False
+        self.rank = 0
+        self.offset = 0
+
+
+class TwoLevelTour:
+
+    def __init__(self, solution):
+        self.n = len(solution)
+        self.block_size = max(int(math.sqrt(self.n)), 8)
+        self.block_of = [None]*self.n
+        self.raw = array.array('i', [0]*self.n)
+        self._build(list(solution))
+
+    def _build(self, solution):
+        self.blocks = []
+        for start in range(0, self.n, self.block_size):
+            block = Block(solution[start:start + self.block_size])
+            self._own(block, 0)
+            self.blocks.append(block)
+        self._renumber(0)
+
+    def _own(self, block, start):
+        for i in range(start, len(block.cities)):
+            city = block.cities[i]
+            self.block_of[city] = block
+            self.raw[city] = i
+
+    def _renumber(self, start):
+        offset = self.blocks[start - 1].offset + len(self.blocks[start - 1].cities) if start > 0 else 0
+        for rank in range(start, len(self.blocks)):
+            block = self.blocks[rank]
+            block.rank = rank
+            block.offset = offset
+            offset += len(block.cities)
+
+    def _index(self, city):
+        # index of the city inside its block, in tour direction
+        block = self.block_of[city]
+        if block.reversed:
+            return len(block.cities) - 1 - self.raw[city]
+        return self.raw[city]
+
+    def _at(self, block, index):
+        if block.reversed:
+            return block.cities[len(block.cities) - 1 - index]
+        return block.cities[index]
+
+    def position(self, city):
+        return self.block_of[city].offset + self._index(city)
+
+    def next(self, city):
+        block = self.block_of[city]
+        index = self._index(city) + 1
+        if index == len(block.cities):
+            return self._at(self.blocks[(block.rank + 1) % len(self.blocks)], 0)
+        return self._at(block, index)
+
+    def prev(self, city):
+        block = self.block_of[city]
+        index = self._index(city) - 1
+        if index < 0:
+            block = self.blocks[block.rank - 1]
+            return self._at(block, len(block.cities) - 1)
+        return self._at(block, index)
+
+    def between(self, a, b, c):
+        pa = self.position(a)
+        pb = self.position(b)
+        pc = self.position(c)
+        if pa <= pc:
+            return pa <= pb <= pc
+        return pb >= pa or pb <= pc
+
+    def _normalize(self, block):
+        if block.reversed:
+            block.cities.reverse()
+            block.reversed = False
+            self._own(block, 0)
+
+    def _split(self, city):
+        # makes city the first one of its block
+        block = self.block_of[city]
+        index = self._index(city)
+        if index == 0:
+            return
+        self._normalize(block)
+        tail = Block(block.cities[index:])
+        del block.cities[index:]
+        self._own(tail, 0)
+        self.blocks.insert(block.rank + 1, tail)
+        self._renumber(block.rank)
+
+    def _merge(self, rank):
+        # merges the block at rank with the following one when both are small
+        if len(self.blocks) < 2:
+            return
+        first = self.blocks[rank % len(self.blocks)]
+        second = self.blocks[(rank + 1) % len(self.blocks)]
+        if second.rank == 0 or len(first.cities) + len(second.cities) > 2 * self.block_size:
+            return
+        self._normalize(first)
+        self._normalize(second)
+        start = len(first.cities)
+        first.cities.extend(second.cities)
+        self._own(first, start)
+        del self.blocks[second.rank]
+        self._renumber(first.rank)
+
+    def _reverse(self, a, b):
+        # reverses the path going forward from a to b
+        n = self.n
+        if ((self.position(b) - self.position(a)) % n + 1) * 2 > n:
+            (a, b) = (self.next(b), self.prev(a))
+
+        self._split(a)
+        after = self.next(b)
+        if after != a:
+            self._split(after)
+
+        first = self.block_of[a].rank
+        last = self.block_of[b].rank
+        if first > last:
+            # the path wraps around the end of the block list, rotate it
+            self.blocks = self.blocks[first:] + self.blocks[:first]
+            self._renumber(0)
+            first = 0
+            last = self.block_of[b].rank
+
+        path = self.blocks[first:last + 1]
+        path.reverse()
+        for block in path:
+            block.reversed = not block.reversed
+        self.blocks[first:last + 1] = path
+        self._renumber(first)
+
+        self._merge(last)
+        self._merge(first - 1)
+
+        if len(self.blocks) > 4 * (self.n / self.block_size + 1):
+            self._build(self.cities())
+
+    def move(self, a, b, c, d):
+        if self.next(a) == b:
+            self._reverse(b, c)
+        else:
+            self._reverse(c, b)
+
+    def cities(self):
+        result = []
+        for block in self.blocks:
+            if block.reversed:
+                result.extend(reversed(block.cities))
+            else:
+                result.extend(block.cities)
+        return result
+
+
+class CostedTour:
+
+    def __init__(self, tour, distances, length=None, verify=False):
+        self.tour = tour
+        self.distances = distances
+        self.verify = verify
+        self._x = distances._x.tolist()
+        self._y = distances._y.tolist()
+        self._scale = distances._scale
+        self.length = distances.obj(tour.cities()) if length is None else length
+        if verify:
+            self.check()
+
+    def dist(self, a, b):
+        return math.hypot(self._x[a] - self._x[b], self._y[a] - self._y[b]) * self._scale
+
+    def next(self, city):
+        return self.tour.next(city)
+
+    def prev(self, city):
+        return self.tour.prev(city)
+
+    def between(self, a, b, c):
+        return self.tour.between(a, b, c)
+
+    def move(self, a, b, c, d):
+        self.tour.move(a, b, c, d)
+        self.length += self.dist(a, c) + self.dist(b, d) - self.dist(a, b) - self.dist(c, d)
+        if self.verify:
+            self.check()
+
+    def check(self):
+        exact = self.distances.obj(self.tour.cities())
+        assert abs(exact - self.length) <= VERIFY_TOLERANCE * max(exact, 1.0), (exact, self.length)
+
+    def cities(self):
+        return self.tour.cities()
+
+
+def insert_segment(tour, s1, s2, c, d, keep_orientation=True):
+    # moves the segment s1..s2 (going forward) between c and d = next(c),
+    # c lying outside the segment and not right before it:
+    #   p S n .. c d  ->  p n .. c S' d  ->  p n .. c S d
+    p = tour.prev(s1)
+    n = tour.next(s2)
+    tour.move(p, s1, c, d)
+    tour.move(p, c, n, s2)
+    if keep_orientation:
+        tour.move(c, s2, s1, d)
@@ -1,6 +1,13 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import instance
+from common.distance import DistanceMatrix
+from common import routing as routing_costs
+from common import anytime
 import math
 import array
 from collections import namedtuple
@@ -9,48 +16,22 @@ from ortools.constraint_solver import pywrapcp
 from ortools.linear_solver import pywraplp
 
 Customer = namedtuple("Customer", ['index', 'demand', 'x', 'y'])
-Segment = namedtuple("Segment", ['f', 't', 'id'])
-
-class DistanceMatrix:
-    
-    def __init__(self, points):
-        self._points = points
-        l = len(points)
-        self._distances = [-1 for i in range(l*(l+1)/2)]
-
-    def _distance(self, i,j):
-        return self._distanceP(self._points[i], self._points[j])
-    
-    def _distanceP(self, p0, p1):
-        return math.sqrt((p0.x - p1.x)**2 + (p0.y - p1.y)**2) * 100
-
-    def _distanceBuffered(self, i, j):
-        if (j > i):
-            i,j = j,i
-        k = (i * (i + 1) / 2) + j        
-        l = self._distances[k]
-        if l == -1:
-            l = self._distance(i,j)
-            self._distances[k] = l
-        return l
 
-    def get(self, i, j):
-        return self._distanceBuffered(i,j)    
-
-
-    def obj(self, solution):
-        return sum([self._distanceP(s[0],s[1]) for s in segmentize(self._points)])
-
-def segmentize(points):
-    l = len(points)
-    s = [Segment(points[i], points[i+1], i) for i in range(l - 1)]
-    s.append(Segment(points[-1], points[0], l))
-    return s    
+# seconds for the whole run, the best tours so far are kept in CHECKPOINT
+TIME_LIMIT = 15 * 60
+CHECKPOINT = "solution"
 
 def length(customer1, customer2):
     return math.sqrt((customer1.x - customer2.x)**2 + (customer1.y - customer2.y)**2)
 
-def solve_routing(customers, customerCount, vehicleCount, vehicleCapacity):
+def format_output(obj, vehicle_tours):
+    outputData = str(obj) + ' ' + str(0) + '\n'
+    for tour in vehicle_tours:
+        outputData += ' '.join([str(customer_index) for customer_index in ([0] + tour + [0])]) + '\n'
+    return outputData
+
+def solve_routing(customers, customerCount, vehicleCount, vehicleCapacity, initial, driver):
+    # improves the initial tours until the driver's time limit
 
     distanceMatrix = DistanceMatrix(customers)
 
@@ -58,7 +39,6 @@ def solve_routing(customers, customerCount, vehicleCount, vehicleCapacity):
     print vehicleCount
 
     routing = pywrapcp.RoutingModel(customerCount, vehicleCount)
-    routing.UpdateTimeLimit(15 * 60 * 1000)
 
     parameters = pywrapcp.RoutingSearchParameters()
     # Setting first solution heuristic (cheapest addition).
@@ -70,10 +50,8 @@ def solve_routing(customers, customerCount, vehicleCount, vehicleCapacity):
     parameters.no_lns = True
     
 
-    cost = distanceMatrix.get
-
     routing.SetDepot(0)
-    routing.SetCost(cost)
+    cost = routing_costs.set_cost(routing, distanceMatrix)
 
     capacity = lambda i,j: customers[i].demand
 
@@ -85,9 +63,6 @@ def solve_routing(customers, customerCount, vehicleCount, vehicleCapacity):
     
     routing.CloseModel()
     
-    (obj, initial) = solve_default(customers, customerCount, vehicleCount, vehicleCapacity)
-    
-    
     print "loading initial assignment"
     assignment = routing.solver().Assignment()
     for vehicle in range(vehicleCount):
@@ -106,7 +81,13 @@ def solve_routing(customers, customerCount, vehicleCount, vehicleCapacity):
     	assignment.SetValue(lastVar, routing.End(vehicle))
         		
     print "solving"
-    assignment = routing.SolveWithParameters(parameters, assignment)
+    routing_costs.report(routing, cost)
+    # the limit is taken only now, after the model is built
+    routing.UpdateTimeLimit(int(driver.native_limit() * 1000))
+    assignment = driver.native(routing.SolveWithParameters, parameters, assignment)
+    if assignment is None:
+        return (None, None)
+    routing_costs.report(routing, cost)
 
     vehicle_tours = []
 
@@ -178,35 +159,33 @@ def solve_it(input_data):
     # Modify this code to run your optimization algorithm
 
     # parse the input
-    lines = input_data.split('\n')
+    problem = instance.parse(input_data, 'vrp')
 
-    parts = lines[0].split()
-    customer_count = int(parts[0])
-    vehicle_count = int(parts[1])
-    vehicle_capacity = int(parts[2])
+    customer_count = len(problem.demands)
+    vehicle_count = problem.vehicle_count
+    vehicle_capacity = problem.vehicle_capacity
     
-    customers = []
-    for i in range(1, customer_count+1):
-        line = lines[i]
-        parts = line.split()
-        customers.append(Customer(i-1, int(parts[0]), float(parts[1]), float(parts[2])))
+    customers = [Customer(i, demand, x, y) for (i, (demand, x, y)) in enumerate(zip(problem.demands.tolist(), problem.x.tolist(), problem.y.tolist()))]
 
 
-    # build a trivial solution
-    # assign customers to vehicles starting by the largest customer demands
-    
-    (obj, vehicle_tours) = solve_routing(customers, customer_count, vehicle_count, vehicle_capacity)
+    driver = anytime.Anytime(TIME_LIMIT, CHECKPOINT, format_output)
 
-    # prepare the solution in the specified output format
-    outputData = str(obj) + ' ' + str(0) + '\n'
-    for v in range(0, vehicle_count):
-        outputData += ' '.join([str(customer_index) for customer_index in ([0] + vehicle_tours[v] + [0])]) + '\n'
+    def construct_phase(seconds):
+        # build a trivial solution
+        # assign customers to vehicles starting by the largest customer demands
+        driver.offer(*solve_default(customers, customer_count, vehicle_count, vehicle_capacity))
 
-    f = open("solution",'w')
-    f.write(outputData)
-    f.close()
+    def improve_phase(seconds):
+        driver.offer(*solve_routing(customers, customer_count, vehicle_count, vehicle_capacity,
+                                    driver.solution(), driver))
 
-    return outputData
+    (obj, vehicle_tours) = driver.run([
+        ('construct', 0.0, construct_phase),
+        ('improve', 1.0, improve_phase),
+    ])
+
+    # prepare the solution in the specified output format
+    return format_output(obj, vehicle_tours)
 
 
 import sys
@@ -214,9 +193,7 @@ import sys
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         file_location = sys.argv[1].strip()
-        input_data_file = open(file_location, 'r')
-        input_data = ''.join(input_data_file.readlines())
-        input_data_file.close()
+        input_data = instance.load(file_location, 'vrp')
         print 'Solving:', file_location
         print solve_it(input_data)
     else: